@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.altistore
+Persistent SQLite store of elevation samples, keyed by lon/lat quantized to
+1e-7 degree (the sampling grid of fetch_alti is snapped to the step in a
+metric CRS, so overlapping jobs hit the same keys). Every chunk is stored as
+it arrives, so an interrupted fetch resumes with the samples it already got.
+"""
+
+import os
+import sqlite3
+import threading
+import numpy as np
+
+from .config import CACHE_DIR
+
+QUANTUM = 1e7  # 1e-7 degree, about 1 cm
+
+
+def quantize(lon, lat):
+    """Integer keys for lon/lat scalars or arrays."""
+    return (np.round(np.asarray(lon) * QUANTUM).astype(np.int64),
+            np.round(np.asarray(lat) * QUANTUM).astype(np.int64))
+
+
+class AltiStore:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, "alti.sqlite")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as c:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                "qlon INTEGER NOT NULL, qlat INTEGER NOT NULL, z REAL NOT NULL, "
+                "PRIMARY KEY (qlon, qlat)) WITHOUT ROWID"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread: fetch_alti may be called from worker threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    # -------- samples --------
+    def lookup(self, qlon, qlat):
+        """Elevations for the quantized keys `qlon`/`qlat` (int arrays), NaN where unknown."""
+        qlon = np.asarray(qlon, dtype=np.int64)
+        qlat = np.asarray(qlat, dtype=np.int64)
+        z = np.full(len(qlon), np.nan)
+        c = self._conn()
+        c.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (i INTEGER, qlon INTEGER, qlat INTEGER)")
+        c.execute("DELETE FROM wanted")
+        c.executemany("INSERT INTO wanted VALUES (?, ?, ?)", zip(range(len(qlon)), qlon.tolist(), qlat.tolist()))
+        rows = c.execute(
+            "SELECT w.i, s.z FROM wanted w JOIN samples s ON s.qlon = w.qlon AND s.qlat = w.qlat"
+        ).fetchall()
+        c.execute("DELETE FROM wanted")
+        c.commit()
+        if rows:
+            idx, vals = np.array(rows).T
+            z[idx.astype(np.int64)] = vals
+        return z
+
+    def store_chunk(self, qlon, qlat, z):
+        """Store one chunk's samples in one transaction."""
+        rows = zip(np.asarray(qlon).tolist(), np.asarray(qlat).tolist(), np.asarray(z, dtype=float).tolist())
+        with self._conn() as c:
+            c.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?)", rows)
+
+
+_default_store = None
+
+def default_store() -> AltiStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = AltiStore()
+    return _default_store
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.batch
+Headless batch export: reads a CSV or JSONL list of sites (an `address`
+column, or `lon`/`lat` columns) and writes one DXF per site plus a
+summary CSV, running the jobs on a process or thread pool.
+
+    python -m cadastre_app.batch sites.csv -o out/ --radius 200 --step 5 -j 4
+
+Optional per-row columns override the command line: name, postcode,
+radius, step, alti, adaptive, tolerance, compact, binary, tin, contours,
+extent. The summary reports output size and write time per job, so DXF
+modes can be compared; --metrics adds a per-stage JSON next to each DXF.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from logging.handlers import QueueListener
+from typing import Optional
+
+from .config import DEFAULT_STEP, ALTI_TOLERANCE
+from .geocode import geocode, geocode_batch, default_geocode_cache, Address, GeocodeResult
+from .pipeline import ExportJob, run_export
+from .metrics import Metrics, NO_METRICS
+from .logutil import setup_logger, forward_to_queue
+
+SUMMARY_FIELDS = [
+    "row", "label", "lon", "lat", "radius", "step", "out_path", "target_epsg",
+    "n_buildings", "n_parcelles", "n_points_alti", "n_faces", "n_contours", "n_repaired", "n_dropped",
+    "dxf_format", "size_bytes", "write_seconds", "bytes_downloaded", "seconds",
+    "status", "error",
+]
+
+
+def read_rows(path):
+    if path.lower().endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        return [dict(r) for r in csv.DictReader(f, dialect=dialect)]
+
+
+def _as_bool(v, default=True):
+    if v is None or v == "":
+        return default
+    if isinstance(v, bool):
+        return v
+    return str(v).strip().lower() not in ("0", "false", "non", "no", "n")
+
+
+def _has_lonlat(row):
+    return row.get("lon") not in (None, "") and row.get("lat") not in (None, "")
+
+
+def geocode_rows(rows, cache=None) -> dict:
+    """Geocode in bulk every row with an `address` but no lon/lat: {row index: GeocodeResult}."""
+    idx = [i for i, row in enumerate(rows) if not _has_lonlat(row) and (row.get("address") or "").strip()]
+    if not idx:
+        return {}
+    found = geocode_batch([rows[i]["address"].strip() for i in idx],
+                          [rows[i].get("postcode") or "" for i in idx], cache=cache)
+    return dict(zip(idx, found))
+
+
+def resolve_address(row, geocoded: Optional[GeocodeResult] = None) -> Address:
+    """
+    Build an Address from a row: lon/lat if given, otherwise the bulk geocoding
+    answer `geocoded`, or a single geocoding query of `address`.
+    """
+    lon, lat = row.get("lon"), row.get("lat")
+    if _has_lonlat(row):
+        lon = float(str(lon).replace(",", "."))
+        lat = float(str(lat).replace(",", "."))
+        label = row.get("name") or row.get("address") or f"{lon:.6f}_{lat:.6f}"
+        return Address(label=label, lon=lon, lat=lat,
+                       postcode=str(row.get("postcode") or ""), citycode="")
+    query = (row.get("address") or "").strip()
+    if not query:
+        raise ValueError("ni adresse ni lon/lat")
+    if geocoded is not None:
+        if geocoded.address is None:
+            detail = f" ({geocoded.error})" if geocoded.error else ""
+            raise LookupError(f"adresse introuvable [{geocoded.status}] : {query}{detail}")
+        return geocoded.address
+    res = geocode(query, limit=1)
+    if res is None:
+        raise LookupError(f"adresse introuvable : {query}")
+    return res[0] if isinstance(res, list) else res
+
+
+def build_jobs(rows, out_dir, radius=20, step=DEFAULT_STEP, alti=True, cache=True,
+               adaptive=False, tolerance=ALTI_TOLERANCE, streaming=False, compact=False, binary=False, tin="",
+               contour_interval=0.0, server_crs=True, extent="square", clip="clip",
+               metrics=False, profile_dir="", batch_metrics: Metrics = NO_METRICS):
+    """Return ([(row_index, ExportJob)], [failed summary rows])."""
+    jobs, failed = [], []
+    used = set()
+    # one upload to the CSV geocoder for the whole file instead of one request per row
+    with batch_metrics.span("geocode_batch") as rec:
+        geocoded = geocode_rows(rows, default_geocode_cache() if cache else None)
+        rec["items"] = len(geocoded)
+    for i, row in enumerate(rows):
+        try:
+            addr = resolve_address(row, geocoded.get(i))
+        except Exception as e:
+            failed.append({"row": i, "label": row.get("address") or row.get("name", ""),
+                           "status": "geocode-error", "error": str(e)})
+            continue
+        safe_name = re.sub(r'[\\/*?:"<>|]', "_", row.get("name") or addr.label)
+        name = safe_name
+        n = 1
+        while name.lower() in used:
+            n += 1
+            name = f"{safe_name}_{n}"
+        used.add(name.lower())
+        jobs.append((i, ExportJob(
+            address=addr,
+            out_path=os.path.join(out_dir, f"{name}.dxf"),
+            metrics_path=os.path.join(out_dir, f"{name}.metrics.json") if metrics else "",
+            profile_dir=profile_dir,
+            radius=int(float(row.get("radius") or radius)),
+            step=int(float(row.get("step") or step)),
+            alti=_as_bool(row.get("alti"), alti),
+            cache=cache,
+            adaptive=_as_bool(row.get("adaptive"), adaptive),
+            tolerance=float(row.get("tolerance") or tolerance),
+            streaming=streaming,
+            compact=_as_bool(row.get("compact"), compact),
+            binary=_as_bool(row.get("binary"), binary),
+            tin=row.get("tin") or tin,
+            contour_interval=float(row.get("contours") or contour_interval),
+            server_crs=server_crs,
+            extent=row.get("extent") or extent,
+            clip=clip,
+        )))
+    return jobs, failed
+
+
+def _run_job(job: ExportJob) -> dict:
+    try:
+        return run_export(job)
+    except Exception as e:
+        return {"label": job.address.label, "lon": job.address.lon, "lat": job.address.lat,
+                "radius": job.radius, "step": job.step, "out_path": job.out_path,
+                "status": "error", "error": f"{type(e).__name__}: {e}"}
+
+
+def run_batch(jobs, workers=None, executor="process", on_result=None):
+    """
+    Run (row_index, ExportJob) pairs on a pool, return summary rows in input order.
+    Worker processes send their "cadastre" log records back to this process's handlers
+    (spawned workers have no logging set up, and only one process may rotate the log).
+    """
+    listener = None
+    if executor == "process":
+        log = logging.getLogger("cadastre")
+        queue = multiprocessing.Queue()
+        listener = QueueListener(queue, *log.handlers, respect_handler_level=True)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=forward_to_queue,
+                                   initargs=(queue, "cadastre", log.getEffectiveLevel()))
+        listener.start()
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    results = []
+    try:
+        with pool:
+            futs = {pool.submit(_run_job, job): i for i, job in jobs}
+            for fut in as_completed(futs):
+                row = dict(fut.result(), row=futs[fut])
+                results.append(row)
+                if on_result is not None:
+                    on_result(row)
+    finally:
+        if listener is not None:
+            listener.stop()
+    results.sort(key=lambda r: r["row"])
+    return results
+
+
+def write_summary(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        w.writeheader()
+        for r in sorted(rows, key=lambda r: r["row"]):
+            w.writerow(r)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="cadastre_app.batch", description="Export DXF en lot")
+    ap.add_argument("input", help="fichier CSV ou JSONL (colonnes address ou lon/lat)")
+    ap.add_argument("-o", "--out-dir", default="dxf_out")
+    ap.add_argument("--radius", type=int, default=20, help="rayon en mètres")
+    ap.add_argument("--step", type=int, default=DEFAULT_STEP, help="pas de la grille alti en mètres")
+    ap.add_argument("--no-alti", action="store_true", help="ne pas télécharger les points altimétriques")
+    ap.add_argument("--adaptive", action="store_true", help="échantillonnage altimétrique adaptatif")
+    ap.add_argument("--tolerance", type=float, default=ALTI_TOLERANCE, help="écart vertical toléré (m)")
+    ap.add_argument("--streaming", action="store_true", help="DXF R12 écrit au fil de l'eau (mémoire constante)")
+    ap.add_argument("--compact", action="store_true", help="contours en LWPOLYLINE avec élévation")
+    ap.add_argument("--binary", action="store_true", help="DXF binaire")
+    ap.add_argument("--tin", choices=("mesh", "3dface"), default="",
+                    help="surface triangulée (MESH ou 3DFACE) au lieu des points altimétriques")
+    ap.add_argument("--contours", type=float, default=0.0, metavar="M",
+                    help="courbes de niveau tous les M mètres au lieu des points altimétriques")
+    ap.add_argument("--circle", action="store_true", help="emprise circulaire (rayon) au lieu du carré")
+    ap.add_argument("--clip", choices=("clip", "filter", "none"), default="clip",
+                    help="clip: découper à l'emprise, filter: garder les entités entières qui la touchent, "
+                         "none: tout ce que renvoie le WFS")
+    ap.add_argument("--local-reproject", action="store_true",
+                    help="télécharger en EPSG:2154 et reprojeter localement au lieu de demander la zone CC au WFS")
+    ap.add_argument("--no-cache", action="store_true", help="ignorer le cache disque des tuiles WFS")
+    ap.add_argument("-j", "--workers", type=int, default=None)
+    ap.add_argument("--executor", choices=("process", "thread"), default="process")
+    ap.add_argument("--summary", default=None, help="CSV de synthèse (défaut: <out-dir>/summary.csv)")
+    ap.add_argument("--metrics", action="store_true",
+                    help="mesures par étape dans <nom>.metrics.json à côté de chaque DXF")
+    ap.add_argument("--profile", default="", metavar="DIR", help="profil cProfile de chaque étape dans DIR")
+    ap.add_argument("-v", "--verbose", action="store_true", help="journal détaillé (chaque page, chaque lot)")
+    args = ap.parse_args(argv)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    logger = setup_logger(log_path=os.path.join(args.out_dir, "batch.log"),
+                          level=logging.DEBUG if args.verbose else logging.INFO)
+    batch_metrics = Metrics(label="batch", logger=logger)
+    rows = read_rows(args.input)
+    jobs, failed = build_jobs(rows, args.out_dir, args.radius, args.step, not args.no_alti,
+                              not args.no_cache, args.adaptive, args.tolerance, args.streaming,
+                              args.compact, args.binary, args.tin, args.contours,
+                              not args.local_reproject, "circle" if args.circle else "square",
+                              "" if args.clip == "none" else args.clip,
+                              args.metrics, args.profile, batch_metrics)
+
+    def on_result(r):
+        print(f"[{r['row']}] {r['status']} {r.get('label', '')} {r.get('error', '')}".rstrip(), flush=True)
+        batch_metrics.count(f"jobs_{r['status']}")
+        batch_metrics.count("bytes_downloaded", r.get("bytes_downloaded") or 0)
+
+    for r in failed:
+        on_result(r)
+    with batch_metrics.span("jobs") as rec:
+        results = run_batch(jobs, args.workers, args.executor, on_result) + failed
+        rec["items"] = len(jobs)
+    write_summary(results, args.summary or os.path.join(args.out_dir, "summary.csv"))
+    batch_metrics.log_summary()
+    if args.metrics:
+        batch_metrics.write_json(os.path.join(args.out_dir, "batch.metrics.json"))
+    return 0 if all(r["status"] == "ok" for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
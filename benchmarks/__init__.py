@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.benchmarks
+Offline benchmarks: a local stand-in for the data.geopf.fr services
+(stubserver), a runner timing each pipeline stage across radius/step
+presets (python -m cadastre_app.benchmarks), and the import-time budget of
+the UI (python -m cadastre_app.benchmarks.startup).
+"""
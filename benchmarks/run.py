@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.benchmarks.run
+Runs pipeline.run_export against the local stand-in server, once per DXF
+output mode, for a series of radius/step presets, and reports the stage
+timings of each export (WFS pages, elevation chunks, repair, clip, write).
+Every preset runs in a fresh process with empty caches, so its first export
+downloads, the next ones read the tile cache, and its peak RSS is its own.
+
+    python -m cadastre_app.benchmarks --presets 20:5,250:5,1000:5 --latency 0.05 --json bench.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from .stubserver import StubServer
+
+PRESETS = [(20, 5), (100, 5), (250, 5), (500, 5), (1000, 5)]
+WRITE_MODES = {
+    "r2018": {},
+    "compact": {"compact": True},
+    "binary": {"compact": True, "binary": True},
+    "streaming": {"streaming": True},
+}
+SITE = ("Site de référence, Paris", 2.3522, 48.8566, "75001", "75101")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, None where it cannot be measured."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / 2 ** 20, 1)
+    except ImportError:
+        return None
+
+
+def run_preset(radius, step, out_dir, modes, alti=True):
+    """
+    One preset, in the calling process, through pipeline.run_export: one ExportJob per
+    write mode on caches of its own, the first one cold (it downloads), the next ones warm.
+    Returns {"stages": [...], "peak_rss_mb": ...}.
+    """
+    from .. import altistore, tilecache, wfs
+    from ..geocode import Address
+    from ..metrics import Metrics
+    from ..pipeline import ExportJob, run_export
+    from ..ratelimit import RateLimiter
+
+    cache_dir = os.path.join(out_dir, f"cache_{radius}_{step}")
+    tilecache._default_cache = tilecache.TileCache(cache_dir)
+    altistore._default_store = altistore.AltiStore(os.path.join(cache_dir, "alti.sqlite"))
+    # the stand-in has no quota: lift the client-side rate limit so the stage measures the client
+    wfs.alti_limiter = RateLimiter(1000, 1000)
+
+    site = Address(*SITE)
+    stages = []
+    for i, mode in enumerate(modes):
+        path = os.path.join(out_dir, f"bench_{radius}_{step}_{mode}.dxf")
+        job = ExportJob(site, path, radius=radius, step=step, alti=alti, **WRITE_MODES[mode])
+        metrics = Metrics(label=f"bench_{radius}_{step}_{mode}")
+        row = run_export(job, metrics=metrics)
+        n = row["n_buildings"] + row["n_parcelles"] + row["n_points_alti"]
+        stages.append({"stage": "export", "mode": mode, "cache": "chaud" if i else "froid",
+                       "seconds": row["seconds"], "items": n, "unit": "entités",
+                       "per_second": round(n / row["seconds"], 1) if row["seconds"] > 0 else None,
+                       "size_bytes": row["size_bytes"], "bytes_downloaded": row["bytes_downloaded"]})
+        for name, st in sorted(metrics.summary()["stages"].items()):
+            stages.append({"stage": name, "mode": mode, "seconds": st["seconds"], "items": st["items"],
+                           "unit": "éléments", "per_second": st["items_per_s"]})
+        os.remove(path)
+    return {"radius": radius, "step": step, "stages": stages, "peak_rss_mb": peak_rss_mb()}
+
+
+def _parse_presets(text):
+    out = []
+    for item in text.split(","):
+        radius, _, step = item.strip().partition(":")
+        out.append((int(radius), int(step or 5)))
+    return out
+
+
+def print_report(results, out=sys.stdout):
+    for r in results:
+        out.write(f"\n== rayon {r['radius']} m / pas {r['step']} m  (pic RSS {r['peak_rss_mb']} Mo)\n")
+        for s in r["stages"]:
+            if s["stage"] == "export":
+                out.write(f"  -- {s['mode']} (cache {s['cache']}) : {s['seconds']:.3f} s, "
+                          f"{s['size_bytes'] / 2 ** 20:.2f} Mo écrits, "
+                          f"{s['bytes_downloaded'] / 2 ** 20:.2f} Mo téléchargés\n")
+                continue
+            out.write(f"    {s['stage']:<32}{s['seconds']:>9.3f} s {s['items']:>9} {s['unit']:<9}"
+                      f"{s['per_second'] or 0:>12.1f} /s\n")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Mesure hors ligne des étapes du pipeline (serveur local imitant geopf).")
+    ap.add_argument("--presets", default=",".join(f"{r}:{s}" for r, s in PRESETS),
+                    help="liste rayon:pas, ex. 20:5,1000:5")
+    ap.add_argument("--modes", default=",".join(WRITE_MODES), help="modes d'écriture DXF à mesurer")
+    ap.add_argument("--no-alti", action="store_true")
+    ap.add_argument("--latency", type=float, default=0.05, help="délai du serveur local par réponse (s)")
+    ap.add_argument("--max-page", type=int, default=5000, help="taille maximale d'une page WFS")
+    ap.add_argument("--replay", default=None, help="dossier de réponses enregistrées à rejouer")
+    ap.add_argument("--json", default=None, help="écrire les résultats dans ce fichier JSON")
+    args = ap.parse_args(argv)
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(WRITE_MODES)
+    if unknown:
+        ap.error(f"modes inconnus : {', '.join(sorted(unknown))}")
+
+    server = StubServer(latency=args.latency, max_page=args.max_page, replay_dir=args.replay)
+    os.environ["CADASTRE_GEOPF_URL"] = server.start()
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            for radius, step in _parse_presets(args.presets):
+                # fresh interpreter per preset: isolated peak RSS, cold caches
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    results.append(pool.submit(run_preset, radius, step, out_dir, modes, not args.no_alti).result())
+                print_report(results[-1:])
+    finally:
+        server.stop()
+    report = {"latency": args.latency, "max_page": args.max_page, "server": server.stats, "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
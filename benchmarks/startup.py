@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.benchmarks.startup
+Import-time budget of the UI: `import cadastre_app.ui` in a fresh
+interpreter must stay under the budget and must not load the geo stack,
+which the window preloads in the background instead. Exits with status 1
+when the budget is exceeded, so it can gate a build.
+
+    python -m cadastre_app.benchmarks.startup --budget 0.5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PACKAGE = (__package__ or __name__).split(".")[0]
+BUDGET_S = 0.5
+HEAVY_MODULES = ("geopandas", "pandas", "pyproj", "shapely", "ezdxf", "numpy")
+
+_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - t
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module=None, repeat=3):
+    """Best of `repeat` cold imports of `module`: {"seconds": ..., "loaded": [heavy modules imported]}."""
+    module = module or f"{PACKAGE}.ui"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                             env=env, capture_output=True, text=True, check=True).stdout
+        res = json.loads(out.strip().splitlines()[-1])
+        if best is None or res["seconds"] < best["seconds"]:
+            best = res
+    return best
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Budget de temps d'import de l'interface.")
+    ap.add_argument("--budget", type=float, default=BUDGET_S, help="durée maximale de l'import (s)")
+    ap.add_argument("--module", default=f"{PACKAGE}.ui")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    res = measure(args.module, args.repeat)
+    ok = res["seconds"] <= args.budget and not res["loaded"]
+    print(f"import {args.module} : {res['seconds']:.3f} s (budget {args.budget:.3f} s)"
+          + (f", modules lourds chargés : {', '.join(res['loaded'])}" if res["loaded"] else ""))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.benchmarks.stubserver
+Local HTTP stand-in for the geopf services used by the app (WFS GetFeature,
+altimetry, geocoding search and CSV batch search), with configurable latency
+and server page size. Answers are synthetic and deterministic -- building
+and parcel lattices in the requested CRS, a smooth analytic terrain -- or
+replayed from responses recorded against the real services.
+
+    python -m cadastre_app.benchmarks.stubserver --port 8765 --latency 0.08
+    CADASTRE_GEOPF_URL=http://127.0.0.1:8765 python -m cadastre_app
+"""
+
+import argparse
+import csv
+import email
+import hashlib
+import io
+import json
+import math
+import os
+import threading
+import time
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+BUILDING_SPACING = 20.0  # m between building footprints
+BUILDING_SIZE = (12.0, 9.0)
+PARCEL_SPACING = 60.0
+
+
+def terrain(lon, lat):
+    """Synthetic elevation (m): gentle slope plus hills a few hundred metres wide."""
+    return (120.0 + 400.0 * (lat - 48.0) + 25.0 * math.sin(lon * 900.0) * math.cos(lat * 1200.0)
+            + 8.0 * math.sin(lon * 4100.0 + lat * 3000.0))
+
+
+def _lattice(bbox, spacing):
+    x0, y0, x1, y1 = bbox
+    for ix in range(math.floor(x0 / spacing), math.ceil(x1 / spacing) + 1):
+        for iy in range(math.floor(y0 / spacing), math.ceil(y1 / spacing) + 1):
+            yield ix, iy
+
+
+def _building(ix, iy):
+    w, h = BUILDING_SIZE
+    x, y = ix * BUILDING_SPACING + 4.0, iy * BUILDING_SPACING + 4.0
+    ring = [[x, y], [x + w, y], [x + w, y + h], [x + w * 0.5, y + h + 3.0], [x, y + h], [x, y]]
+    hauteur = 3.0 + (ix * 7 + iy * 3) % 25
+    return {"type": "Feature", "id": f"batiment.{ix}_{iy}",
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+            "properties": {"hauteur": hauteur, "altitude_minimale_toit": None, "altitude_maximale_toit": None}}
+
+
+def _parcel(ix, iy):
+    s = PARCEL_SPACING
+    x, y = ix * s, iy * s
+    # split each lattice cell in two lots along a slanted line: irregular but gap-free
+    k = ((ix * 31 + iy * 17) % 5) / 10.0 + 0.3
+    if (ix + iy) % 2:
+        lots = [[[x, y], [x + s * k, y], [x + s * (1 - k), y + s], [x, y + s], [x, y]],
+                [[x + s * k, y], [x + s, y], [x + s, y + s], [x + s * (1 - k), y + s], [x + s * k, y]]]
+    else:
+        lots = [[[x, y], [x + s, y], [x + s, y + s], [x, y + s], [x, y]]]
+    return [{"type": "Feature", "id": f"parcelle.{ix}_{iy}_{n}",
+             "geometry": {"type": "Polygon", "coordinates": [ring]},
+             "properties": {"idu": f"{ix}{iy}{n}"}} for n, ring in enumerate(lots)]
+
+
+def _intersects(feature, bbox):
+    xs = [p[0] for p in feature["geometry"]["coordinates"][0]]
+    ys = [p[1] for p in feature["geometry"]["coordinates"][0]]
+    return min(xs) <= bbox[2] and max(xs) >= bbox[0] and min(ys) <= bbox[3] and max(ys) >= bbox[1]
+
+
+def wfs_features(layer, bbox):
+    if "batiment" in layer.lower():
+        feats = [_building(ix, iy) for ix, iy in _lattice(bbox, BUILDING_SPACING)]
+    else:
+        feats = [f for ix, iy in _lattice(bbox, PARCEL_SPACING) for f in _parcel(ix, iy)]
+    return [f for f in feats if _intersects(f, bbox)]
+
+
+class StubServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, max_page=5000,
+                 replay_dir=None, upstream=None):
+        """
+        `latency`: seconds added to every answer. `max_page`: largest WFS page served
+        (count is clamped like the real server does). With `replay_dir`, recorded answers
+        are served when present; with `upstream` as well, missing ones are fetched from
+        it and recorded.
+        """
+        self.latency = float(latency)
+        self.max_page = int(max_page)
+        self.replay_dir = replay_dir
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.stats = {"requests": 0, "bytes": 0, "wfs": 0, "alti": 0, "geocode": 0, "replayed": 0}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, service, nbytes):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += nbytes
+            self.stats[service] = self.stats.get(service, 0) + 1
+
+    # -------- record / replay --------
+    def _key(self, method, path, query, body):
+        h = hashlib.sha1()
+        for part in (method, path, urlencode(sorted(query.items())), body or b""):
+            h.update(part if isinstance(part, bytes) else part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _replay(self, key):
+        if not self.replay_dir:
+            return None
+        path = os.path.join(self.replay_dir, key)
+        if not os.path.exists(path + ".json"):
+            return None
+        with open(path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(path + ".body", "rb") as f:
+            return meta["status"], meta["content_type"], f.read()
+
+    def _record(self, key, method, path_qs, body, headers):
+        req = urllib.request.Request(self.upstream + path_qs, data=body if method == "POST" else None,
+                                     method=method, headers={k: v for k, v in headers.items()
+                                                             if k.lower() in ("content-type", "accept", "user-agent")})
+        with urllib.request.urlopen(req, timeout=120) as r:
+            status, ctype, data = r.status, r.headers.get("Content-Type", ""), r.read()
+        os.makedirs(self.replay_dir, exist_ok=True)
+        path = os.path.join(self.replay_dir, key)
+        with open(path + ".body", "wb") as f:
+            f.write(data)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"status": status, "content_type": ctype, "request": path_qs}, f)
+        return status, ctype, data
+
+    # -------- synthetic services --------
+    def _wfs(self, q):
+        bbox = [float(v) for v in q.get("bbox", "0,0,0,0").split(",")[:4]]
+        feats = wfs_features(q.get("typenames", ""), bbox)
+        if q.get("resultType") == "hits":
+            body = (f'<?xml version="1.0"?><wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" '
+                    f'numberMatched="{len(feats)}" numberReturned="0"/>')
+            return 200, "text/xml", body.encode()
+        start = int(q.get("startIndex", 0))
+        count = min(int(q.get("count", self.max_page)), self.max_page)
+        page = feats[start:start + count]
+        crs = q.get("srsName", "EPSG:2154")
+        body = {"type": "FeatureCollection", "features": page, "numberMatched": len(feats),
+                "numberReturned": len(page), "crs": {"type": "name", "properties": {"name": crs}}}
+        return 200, "application/json", json.dumps(body).encode()
+
+    def _alti(self, body):
+        d = json.loads(body or b"{}")
+        sep = d.get("delimiter", "|")
+        lons = [float(v) for v in str(d.get("lon", "")).split(sep) if v]
+        lats = [float(v) for v in str(d.get("lat", "")).split(sep) if v]
+        zs = [round(terrain(lon, lat), 2) for lon, lat in zip(lons, lats)]
+        if str(d.get("zonly", "false")).lower() == "true":
+            out = {"elevations": zs}
+        else:
+            out = {"elevations": [{"lon": lon, "lat": lat, "z": z, "acc": 2.5} for lon, lat, z in zip(lons, lats, zs)]}
+        return 200, "application/json", json.dumps(out).encode()
+
+    @staticmethod
+    def _place(query):
+        h = int(hashlib.md5(query.lower().encode()).hexdigest()[:8], 16)
+        return 2.2 + (h % 1000) / 4000.0, 48.8 + (h // 1000 % 1000) / 8000.0
+
+    def _geocode(self, q):
+        query = q.get("q", "")
+        limit = int(q.get("limit", 5))
+        feats = []
+        for i in range(min(limit, 5)):
+            lon, lat = self._place(f"{query}#{i}")
+            feats.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                          "properties": {"label": f"{query} ({i + 1})" if i else query, "score": 0.95 - 0.1 * i,
+                                         "importance": 0.5, "postcode": "75001", "citycode": "75101"}})
+        return 200, "application/json", json.dumps({"type": "FeatureCollection", "features": feats}).encode()
+
+    def _geocode_csv(self, headers, body):
+        msg = email.message_from_bytes(b"Content-Type: " + headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+        parts = {p.get_param("name", header="content-disposition"): p.get_payload(decode=True)
+                 for p in msg.get_payload()}
+        columns = [v.decode() for k, v in parts.items() if k == "columns"] or ["q"]
+        rows = list(csv.DictReader(io.StringIO(parts["data"].decode("utf-8-sig"))))
+        out = io.StringIO()
+        fields = list(rows[0].keys()) if rows else []
+        w = csv.writer(out)
+        w.writerow(fields + ["latitude", "longitude", "result_label", "result_score", "result_postcode",
+                             "result_citycode", "result_status"])
+        for r in rows:
+            query = " ".join(r.get(c, "") for c in columns).strip()
+            if not query:
+                w.writerow([r[f] for f in fields] + ["", "", "", "", "", "", "skipped"])
+                continue
+            lon, lat = self._place(f"{query}#0")
+            w.writerow([r[f] for f in fields] + [lat, lon, query, 0.92, "75001", "75101", "ok"])
+        return 200, "text/csv; charset=utf-8", out.getvalue().encode("utf-8")
+
+    def _answer(self, method, path, q, headers, body):
+        if path.endswith("/wfs/ows"):
+            return "wfs", self._wfs(q)
+        if path.endswith("/elevation.json"):
+            return "alti", self._alti(body)
+        if path.endswith("/geocodage/search/csv"):
+            return "geocode", self._geocode_csv(headers, body)
+        if path.endswith("/geocodage/search"):
+            return "geocode", self._geocode(q)
+        return "other", (404, "text/plain", b"not found")
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real services
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self, method):
+                parts = urlsplit(self.path)
+                q = dict(parse_qsl(parts.query))
+                n = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(n) if n else b""
+                key = server._key(method, parts.path, q, body)
+                found = server._replay(key)
+                if found is not None:
+                    service, (status, ctype, data) = "replayed", found
+                elif server.upstream and server.replay_dir:
+                    service, (status, ctype, data) = "recorded", server._record(key, method, self.path, body, self.headers)
+                else:
+                    service, (status, ctype, data) = server._answer(method, parts.path, q, self.headers, body)
+                if server.latency:
+                    time.sleep(server.latency)
+                server._count(service, len(data))
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+        return Handler
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Serveur local imitant les services geopf (WFS, altimétrie, géocodage).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.05, help="délai ajouté à chaque réponse (s)")
+    ap.add_argument("--max-page", type=int, default=5000, help="taille maximale d'une page WFS")
+    ap.add_argument("--replay", default=None, help="dossier de réponses enregistrées")
+    ap.add_argument("--record-from", default=None,
+                    help="URL du service réel : les réponses absentes de --replay y sont demandées puis enregistrées")
+    args = ap.parse_args(argv)
+    srv = StubServer(args.host, args.port, args.latency, args.max_page, args.replay, args.record_from)
+    print(f"CADASTRE_GEOPF_URL={srv.url}")
+    try:
+        srv._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
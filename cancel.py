@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.cancel
+Cooperative cancellation of an export: the UI (or any caller) cancels a
+CancelToken, the fetch and write loops check it between pages, chunks and
+batches, and the transport closes the response being read. Work already
+finished stays in the tile cache and the altimetry store, so a corrected
+re-run starts from there.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+class Cancelled(Exception):
+    """Raised inside a job whose CancelToken was cancelled."""
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Request cancellation; callbacks registered with on_cancel run at once (on this thread)."""
+        self._event.set()
+        with self._lock:
+            callbacks = list(self._callbacks.values())
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                pass
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+    def sleep(self, seconds: float):
+        """time.sleep that returns early -- raising Cancelled -- when the token is cancelled."""
+        if self._event.wait(max(0.0, seconds)):
+            raise Cancelled()
+
+    @contextmanager
+    def on_cancel(self, fn):
+        """Call `fn` if the token is cancelled while the block runs (e.g. close a response)."""
+        with self._lock:
+            key = self._next
+            self._next += 1
+            self._callbacks[key] = fn
+        try:
+            if self._event.is_set():
+                fn()
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.pop(key, None)
+
+
+@contextmanager
+def child_token(parent: Optional[CancelToken] = None):
+    """A token of its own, also cancelled if `parent` (may be None) is cancelled during the block."""
+    token = CancelToken()
+    if parent is None:
+        yield token
+        return
+    with parent.on_cancel(token.cancel):
+        yield token
+
+
+def check(cancel: Optional[CancelToken]):
+    """Raise Cancelled if `cancel` (may be None) was cancelled."""
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+
+
+def sleep(seconds: float, cancel: Optional[CancelToken] = None):
+    if cancel is None:
+        time.sleep(seconds)
+    else:
+        cancel.sleep(seconds)
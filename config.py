@@ -1,11 +1,21 @@
 # -*- coding: utf-8 -*-
-from requests.adapters import HTTPAdapter, Retry
-import geopandas as gpd
+import os
+from requests.adapters import Retry
 
-WFS_URL = "https://data.geopf.fr/wfs/ows"
+# CADASTRE_GEOPF_URL redirects every service, e.g. to the local stand-in of cadastre_app.benchmarks
+GEOPF_URL = os.environ.get("CADASTRE_GEOPF_URL", "https://data.geopf.fr").rstrip("/")
+WFS_URL = GEOPF_URL + "/wfs/ows"
 LAYER_BUILDINGS = "BDTOPO_V3:batiment"
 LAYER_PARCELLES = "BDPARCELLAIRE-VECTEUR_WLD_BDD_WGS84G:parcelle"
-ALTI_URL = "https://data.geopf.fr/altimetrie/1.0/calcul/alti/rest/elevation.json"
+ALTI_URL = GEOPF_URL + "/altimetrie/1.0/calcul/alti/rest/elevation.json"
+GEOCODE_URL = GEOPF_URL + "/geocodage/search"
+ALTI_MAX_POINTS = 5000 # points max par requête du service altimétrique
+ALTI_RATE = 2.0 # requêtes altimétriques par seconde (seau à jetons)
+ALTI_BURST = 2
+ALTI_CONCURRENCY = 3 # requêtes altimétriques simultanées
+ALTI_RETRIES = 4 # nouvelles tentatives après un 429/503
+ALTI_TOLERANCE = 0.5 # écart vertical toléré (m) en échantillonnage adaptatif
+ALTI_COARSE_FACTOR = 8 # pas de la grille grossière initiale, en multiples du pas demandé
 
 DEPT_TO_CC = {
     # CC42
@@ -63,9 +73,43 @@ DEFAULT_STEP = 50 #pas de la grille alti en mètres
 
 USER_AGENT = "cadastre-app/1.0"
 TIMEOUT = (5, 60)
-RETRIES = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+# our POSTs (altimétrie, géocodage CSV) are read-only queries, so they are retried too
+# (except the CSV upload: see transport.mount_single_post)
+RETRIES = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "HEAD", "POST"}), raise_on_status=False)
+POOL_MAXSIZE = 16 # connexions gardées ouvertes par hôte
+HOST_CONCURRENCY = {"data.geopf.fr": 12} # requêtes simultanées max par hôte
+DEFAULT_HOST_CONCURRENCY = 6
+WFS_PAGE_WORKERS = 4 # pages WFS téléchargées en parallèle
+WFS_PAGE_RETRIES = 1 # en plus des RETRIES du transport : réponses tronquées / JSON invalide
+STREAM_RESPONSES = True # pages WFS et réponses altimétriques lues au fil de l'eau (mémoire réduite)
+FEATURE_BATCH = 500 # objets GeoJSON décodés à la fois en lecture au fil de l'eau
 
-EMPTY_ALTI = gpd.GeoDataFrame(columns=["geometry", "elevations"], geometry="geometry", crs=DEFAULT_CRS_2154)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cadastre_app", "cache")
+LOG_PATH = os.path.join(os.path.expanduser("~"), ".cadastre_app", "cadastre.log")
+METRICS_DIR = os.path.join(os.path.expanduser("~"), ".cadastre_app", "metrics") # un JSON de mesures par export (UI)
+TILE_SIZE_M = 250 # côté des tuiles du cache WFS, en mètres
+CACHE_TTL_S = 7 * 24 * 3600
+CACHE_MAX_BYTES = 500 * 1024 * 1024
+GEOCODE_CACHE_SIZE = 512 # requêtes gardées en mémoire (LRU)
+GEOCODE_TTL_S = 30 * 24 * 3600
+SUGGEST_DELAY_MS = 300 # attente après la dernière frappe avant de proposer des adresses
+SUGGEST_MIN_CHARS = 4
+SUGGEST_LIMIT = 6
+GEOCODE_BATCH_ROWS = 5000 # lignes par envoi au géocodeur CSV
+GEOCODE_BATCH_MIN_ROWS = 1000 # un envoi qui expire est redécoupé en deux jusqu'à cette taille
+GEOCODE_BATCH_TIMEOUT = (5, 180) # le géocodage d'un gros fichier côté serveur est long
+GEOCODE_MIN_SCORE = 0.4 # en dessous, la ligne est regéocodée individuellement
+GEOCODE_FALLBACK_WORKERS = 4
+
+def __getattr__(name):
+    # EMPTY_ALTI is built on first use: importing geopandas here delayed the UI by seconds
+    if name == "EMPTY_ALTI":
+        import geopandas as gpd
+        value = globals()[name] = gpd.GeoDataFrame(columns=["geometry", "elevations"], geometry="geometry",
+                                                   crs=DEFAULT_CRS_2154)
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 TEXT_FONT = ("Futura PT Demi", 14)
 BUTTON_FONT = ("Futura PT Bold", 14)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.contours
+Contour lines from the fetch_alti sample grid: the points are put back on
+their regular grid (nodes skipped by adaptive sampling are interpolated
+from the coarser cells around them), a vectorized marching-squares pass extracts the level
+crossings of every cell at once, and the segments are chained into
+polylines.
+"""
+
+import math
+
+import numpy as np
+import geopandas as gpd
+from shapely import linestrings
+
+NODATA = -99999.0
+
+# corners: 0 = (i, j), 1 = (i+1, j), 2 = (i+1, j+1), 3 = (i, j+1)
+# edges, always oriented the same way so neighbouring cells compute identical points
+EDGES = {0: (0, 1), 1: (1, 2), 2: (3, 2), 3: (0, 3)}
+
+# case index (bit k set = corner k above the level) -> edge pairs; saddles 5 and 10 apart
+SEGMENTS = {
+    1: [(3, 0)], 2: [(0, 1)], 3: [(3, 1)], 4: [(1, 2)], 6: [(0, 2)], 7: [(3, 2)],
+    8: [(2, 3)], 9: [(0, 2)], 11: [(1, 2)], 12: [(1, 3)], 13: [(0, 1)], 14: [(0, 3)],
+}
+# saddles: (segments if the cell centre is above the level, segments otherwise)
+SADDLES = {
+    5: ([(0, 1), (2, 3)], [(3, 0), (1, 2)]),
+    10: ([(3, 0), (1, 2)], [(0, 1), (2, 3)]),
+}
+
+
+def fill_unsampled(Z):
+    """
+    Fill the NaN nodes of an adaptive (quadtree) sampling in place: from the coarsest
+    stride whose lattice is complete, each halving sets missing edge midpoints to the
+    mean of their two ends and cell centres to the mean of the four corners, which
+    reproduces the bilinear surface of every cell that was not refined. +inf marks
+    no-data samples and spreads to the nodes interpolated from them.
+    """
+    if not np.isnan(Z).any():
+        return Z
+    # the finest stride whose lattice (reaching the far edges) is fully sampled
+    s = 1
+    while True:
+        s *= 2
+        if s >= max(Z.shape) or (Z.shape[0] - 1) % s or (Z.shape[1] - 1) % s:
+            return Z
+        if not np.isnan(Z[::s, ::s]).any():
+            break
+    h = s // 2
+    while h >= 1:
+        A = Z[::h, ::h]
+        E = A[::2, ::2]
+        for view, value in ((A[1::2, ::2], (E[:-1] + E[1:]) / 2),
+                            (A[::2, 1::2], (E[:, :-1] + E[:, 1:]) / 2),
+                            (A[1::2, 1::2], (E[:-1, :-1] + E[1:, :-1] + E[:-1, 1:] + E[1:, 1:]) / 4)):
+            gap = np.isnan(view)
+            view[gap] = value[gap]
+        h //= 2
+    return Z
+
+
+def grid_from_points(x, y, z, step):
+    """
+    Put samples lying on a regular `step` lattice back into a 2D array (NaN = no data).
+    Nodes an adaptive sampling skipped are interpolated (fill_unsampled).
+    """
+    x, y, z = (np.asarray(a, dtype=float) for a in (x, y, z))
+    x0, y0 = x.min(), y.min()
+    ix = np.rint((x - x0) / step).astype(np.int64)
+    iy = np.rint((y - y0) / step).astype(np.int64)
+    Z = np.full((ix.max() + 1, iy.max() + 1), np.nan)
+    Z[ix, iy] = np.where(z <= NODATA, np.inf, z)
+    fill_unsampled(Z)
+    Z[~np.isfinite(Z)] = np.nan
+    return x0, y0, Z
+
+
+def marching_squares(Z, level):
+    """All contour segments of `Z` at `level`, as two (S, 2) arrays of endpoints in grid units."""
+    c = [Z[:-1, :-1], Z[1:, :-1], Z[1:, 1:], Z[:-1, 1:]]
+    valid = np.isfinite(c[0]) & np.isfinite(c[1]) & np.isfinite(c[2]) & np.isfinite(c[3])
+    case = sum((np.nan_to_num(c[k], nan=-np.inf) >= level).astype(np.int8) << k for k in range(4))
+    case[~valid] = 0
+    offsets = np.array([(0, 0), (1, 0), (1, 1), (0, 1)], dtype=float)
+
+    def edge_point(ci, cj, edge):
+        a, b = EDGES[edge]
+        va, vb = c[a][ci, cj], c[b][ci, cj]
+        t = (level - va) / (vb - va)
+        pa, pb = offsets[a], offsets[b]
+        return np.column_stack([ci + pa[0] + t * (pb[0] - pa[0]), cj + pa[1] + t * (pb[1] - pa[1])])
+
+    starts, ends = [], []
+
+    def emit(mask, pairs):
+        ci, cj = np.nonzero(mask)
+        for e0, e1 in pairs:
+            starts.append(edge_point(ci, cj, e0))
+            ends.append(edge_point(ci, cj, e1))
+
+    for k, pairs in SEGMENTS.items():
+        emit(case == k, pairs)
+    centre = (c[0] + c[1] + c[2] + c[3]) / 4
+    for k, (above, below) in SADDLES.items():
+        emit((case == k) & (centre >= level), above)
+        emit((case == k) & (centre < level), below)
+    if not starts:
+        return np.empty((0, 2)), np.empty((0, 2))
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def merge_segments(p0, p1, decimals=9):
+    """Chain segments sharing endpoints into polylines (lists of (N, 2) arrays)."""
+    k0 = [tuple(r) for r in np.round(p0, decimals).tolist()]
+    k1 = [tuple(r) for r in np.round(p1, decimals).tolist()]
+    at = {}
+    for s, (a, b) in enumerate(zip(k0, k1)):
+        at.setdefault(a, []).append(s)
+        at.setdefault(b, []).append(s)
+    used = np.zeros(len(k0), bool)
+    pts = {**dict(zip(k0, p0.tolist())), **dict(zip(k1, p1.tolist()))}
+
+    def walk(key, s):
+        chain = []
+        while True:
+            used[s] = True
+            key = k1[s] if k0[s] == key else k0[s]
+            chain.append(key)
+            nxt = [t for t in at[key] if not used[t]]
+            if not nxt:
+                return chain
+            s = nxt[0]
+
+    lines = []
+    for s in range(len(k0)):
+        if used[s]:
+            continue
+        forward = walk(k0[s], s)
+        backward = [k0[s]]
+        # extend from the other end if the chain is not a loop
+        nxt = [t for t in at[k0[s]] if not used[t]]
+        if nxt:
+            backward = walk(k0[s], nxt[0])[::-1] + [k0[s]]
+        keys = backward + forward
+        lines.append(np.array([pts[k] for k in keys]))
+    return lines
+
+
+def contour_lines(x, y, z, step, interval, base=0.0):
+    """Contour polylines every `interval` metres, as (N, 3) arrays in the CRS of x/y."""
+    x0, y0, Z = grid_from_points(x, y, z, step)
+    if not np.isfinite(Z).any() or min(Z.shape) < 2:
+        return []
+    zmin, zmax = np.nanmin(Z), np.nanmax(Z)
+    first = base + math.ceil((zmin - base) / interval) * interval
+    out = []
+    for level in np.arange(first, zmax + interval * 1e-9, interval):
+        p0, p1 = marching_squares(Z, level)
+        for line in merge_segments(p0, p1):
+            if len(line) >= 2:
+                out.append(np.column_stack([x0 + line[:, 0] * step, y0 + line[:, 1] * step,
+                                            np.full(len(line), level)]))
+    return out
+
+
+def contour_gdf(gdf_alti, step, interval, base=0.0):
+    """Contours of a fetch_alti GeoDataFrame (points on the step grid of its CRS), with a `z` column."""
+    crs = getattr(gdf_alti, "crs", None)
+    if gdf_alti is None or gdf_alti.empty:
+        return gpd.GeoDataFrame({"z": []}, geometry=[], crs=crs)
+    xs, ys = gdf_alti.geometry.x.to_numpy(), gdf_alti.geometry.y.to_numpy()
+    lines = contour_lines(xs, ys, gdf_alti["z"].to_numpy(dtype=float), step, interval, base)
+    if not lines:
+        return gpd.GeoDataFrame({"z": []}, geometry=[], crs=crs)
+    coords = np.concatenate([l[:, :2] for l in lines])
+    index = np.repeat(np.arange(len(lines)), [len(l) for l in lines])
+    return gpd.GeoDataFrame({"z": [float(l[0, 2]) for l in lines]}, geometry=linestrings(coords, indices=index), crs=crs)
@@ -1,6 +1,12 @@
 import re
+from functools import lru_cache
+import geopandas as gpd
+import numpy as np
 import requests
+import shapely
+from pyproj import Transformer
 from .config import USER_AGENT, TIMEOUT, CC_TO_EPSG, DEPT_TO_CC, DEFAULT_CRS_2154
+from .features import FeatureTable
 
 
 def epsg_from_postcode(postcode: str, fallback: str = DEFAULT_CRS_2154) -> str:
@@ -13,3 +19,45 @@ def epsg_from_postcode(postcode: str, fallback: str = DEFAULT_CRS_2154) -> str:
         return CC_TO_EPSG["CC42"]
     cc = DEPT_TO_CC.get(dept)
     return CC_TO_EPSG.get(cc, fallback) if cc else fallback
+
+def epsg_from_latitude(lat: float, fallback: str = DEFAULT_CRS_2154) -> str:
+    # CC zones are 1° wide bands centred on 42°N..50°N
+    try:
+        zone = int(round(float(lat)))
+    except (TypeError, ValueError):
+        return fallback
+    return CC_TO_EPSG.get(f"CC{zone}", fallback)
+
+@lru_cache(maxsize=64)
+def get_transformer(src, dst) -> Transformer:
+    """Process-wide Transformer cache: building one costs far more than using it (thread-safe since pyproj 3.1)."""
+    return Transformer.from_crs(src, dst, always_xy=True)
+
+def same_crs(a, b) -> bool:
+    return a is not None and b is not None and str(a).upper() == str(b).upper()
+
+def reproject(gdf, dst):
+    """
+    Like gdf.to_crs(dst), but with a cached Transformer applied to all the
+    coordinates in one vectorized call; no-op when gdf is already in dst.
+    A FeatureTable is transformed on its flat coordinate array.
+    """
+    if isinstance(gdf, FeatureTable):
+        return gdf.to_crs(dst)
+    if gdf.crs is None or same_crs(gdf.crs.to_string(), dst):
+        return gdf
+    t = get_transformer(gdf.crs.to_string(), dst)
+
+    def fwd(xy):
+        x, y = t.transform(xy[:, 0], xy[:, 1])
+        return np.column_stack([x, y])
+
+    geoms = shapely.transform(gdf.geometry.values, fwd)
+    return gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs=dst, name=gdf.geometry.name))
+
+def meters_bbox_around_lonlat(lon, lat, meters, to_metric_crs=DEFAULT_CRS_2154):
+    """Transform WGS84 lon/lat to metric CRS and expand a square bbox by `meters` in each direction."""
+    t = get_transformer("EPSG:4326", to_metric_crs)
+    x, y = t.transform(lon, lat)
+    d = float(meters)
+    return (x - d, y - d, x + d, y + d)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.dxfstream
+Minimal streaming DXF (R12 / AC1009) writer: header, tables and layer
+definitions are written when the file is opened, then every entity goes
+straight to disk, so memory use does not grow with the number of entities.
+Mirrors the few ezdxf modelspace methods used by dxfwriter.
+"""
+
+import os
+from datetime import datetime
+
+
+def _fmt(v) -> str:
+    return repr(float(v))
+
+
+class StreamingDXFWriter:
+    def __init__(self, out_path, layers: dict, encoding="cp1252"):
+        """`layers` maps layer name -> ACI colour."""
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        self.out_path = out_path
+        self._f = open(out_path, "w", encoding=encoding, errors="replace", buffering=1 << 20)
+        self._closed = False
+        self._write_prologue(layers)
+
+    # ezdxf compatibility: the writer is its own modelspace
+    def modelspace(self):
+        return self
+
+    def _write_prologue(self, layers):
+        w = self._f.write
+        w("0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n9\n$DWGCODEPAGE\n3\nANSI_1252\n0\nENDSEC\n")
+        w("0\nSECTION\n2\nTABLES\n")
+        w("0\nTABLE\n2\nLTYPE\n70\n1\n0\nLTYPE\n2\nCONTINUOUS\n70\n0\n3\nSolid line\n72\n65\n73\n0\n40\n0.0\n0\nENDTAB\n")
+        all_layers = {"0": 7, **layers}
+        w(f"0\nTABLE\n2\nLAYER\n70\n{len(all_layers)}\n")
+        for name, color in all_layers.items():
+            w(f"0\nLAYER\n2\n{name}\n70\n0\n62\n{int(color)}\n6\nCONTINUOUS\n")
+        w("0\nENDTAB\n")
+        w("0\nTABLE\n2\nSTYLE\n70\n1\n0\nSTYLE\n2\nSTANDARD\n70\n0\n40\n0.0\n41\n1.0\n50\n0.0\n71\n0\n42\n1.0\n3\ntxt\n4\n\n0\nENDTAB\n")
+        w("0\nENDSEC\n")
+        w("0\nSECTION\n2\nENTITIES\n")
+
+    # -------- entities --------
+    def add_polyline3d(self, points, close=False, dxfattribs=None):
+        layer = (dxfattribs or {}).get("layer", "0")
+        flags = 8 | (1 if close else 0)
+        parts = [f"0\nPOLYLINE\n8\n{layer}\n66\n1\n10\n0.0\n20\n0.0\n30\n0.0\n70\n{flags}\n"]
+        for x, y, z in points:
+            parts.append(f"0\nVERTEX\n8\n{layer}\n10\n{_fmt(x)}\n20\n{_fmt(y)}\n30\n{_fmt(z)}\n70\n32\n")
+        parts.append(f"0\nSEQEND\n8\n{layer}\n")
+        self._f.write("".join(parts))
+
+    def add_lwpolyline(self, points, close=False, dxfattribs=None):
+        """R12 has no LWPOLYLINE: written as a 2D POLYLINE at `elevation` (vertices without Z)."""
+        attribs = dxfattribs or {}
+        layer = attribs.get("layer", "0")
+        elevation = attribs.get("elevation", 0.0)
+        parts = [f"0\nPOLYLINE\n8\n{layer}\n66\n1\n10\n0.0\n20\n0.0\n30\n{_fmt(elevation)}\n70\n{1 if close else 0}\n"]
+        for x, y in points:
+            parts.append(f"0\nVERTEX\n8\n{layer}\n10\n{_fmt(x)}\n20\n{_fmt(y)}\n")
+        parts.append(f"0\nSEQEND\n8\n{layer}\n")
+        self._f.write("".join(parts))
+
+    def add_point(self, location, dxfattribs=None):
+        layer = (dxfattribs or {}).get("layer", "0")
+        x, y, z = location
+        self._f.write(f"0\nPOINT\n8\n{layer}\n10\n{_fmt(x)}\n20\n{_fmt(y)}\n30\n{_fmt(z)}\n")
+
+    def add_points(self, xyz, layer):
+        """Bulk POINT output from an (N, 3) array."""
+        head = f"0\nPOINT\n8\n{layer}\n"
+        self._f.write("".join(f"{head}10\n{_fmt(x)}\n20\n{_fmt(y)}\n30\n{_fmt(z)}\n" for x, y, z in xyz))
+
+    def add_3dface(self, points, dxfattribs=None):
+        layer = (dxfattribs or {}).get("layer", "0")
+        pts = list(points)
+        if len(pts) == 3:
+            pts.append(pts[2])  # triangle: 4th corner repeats the 3rd
+        parts = [f"0\n3DFACE\n8\n{layer}\n"]
+        for i, (x, y, z) in enumerate(pts):
+            parts.append(f"1{i}\n{_fmt(x)}\n2{i}\n{_fmt(y)}\n3{i}\n{_fmt(z)}\n")
+        self._f.write("".join(parts))
+
+    def add_paperspace_text(self, lines, insert=(10.0, 145.0), height=10.0):
+        x, y = insert
+        for i, line in enumerate(lines):
+            self._f.write(
+                f"0\nTEXT\n8\n0\n67\n1\n10\n{_fmt(x)}\n20\n{_fmt(y - i * height * 1.5)}\n30\n0.0\n"
+                f"40\n{_fmt(height)}\n1\n{line}\n"
+            )
+
+    # -------- end of file --------
+    def close(self, address="", target_epsg=""):
+        if self._closed:
+            return
+        if address or target_epsg:
+            self.add_paperspace_text([
+                f"Date: {datetime.now():%Y-%m-%d %H:%M}",
+                f"EPSG: {target_epsg}",
+                f"Adresse: {address}",
+            ])
+        self._f.write("0\nENDSEC\n0\nEOF\n")
+        self._f.close()
+        self._closed = True
+
+    def discard(self):
+        """Close and delete a file that will not be completed."""
+        if not self._closed:
+            self._f.close()
+            self._closed = True
+        try:
+            os.remove(self.out_path)
+        except OSError:
+            pass
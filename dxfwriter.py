@@ -1,46 +1,54 @@
 import os, ezdxf
 from datetime import datetime
-from .geometry import polygon_to_3d_polylines, fix_geom
-import math
-
-def _is_finite3(p):
-    x, y, z = p
-    return all(map(math.isfinite, (x, y, z)))
-
-def _clean_pts(pts):
-    # drop NaN/inf and consecutive duplicates
-    out = []
-    last = None
-    for p in pts:
-        if not _is_finite3(p):
-            continue
-        if last is None or (p[0] != last[0] or p[1] != last[1] or p[2] != last[2]):
-            out.append(p)
-            last = p
-    return out
-
-def _safe_add_polyline3d(msp, pts, layer, close=False):
-    pts = _clean_pts(pts)
-    # need at least two vertices, three if you want to close
-    if len(pts) < 2:
-        return None
-    pl = msp.add_polyline3d(pts, dxfattribs={"layer": layer})
-    if close and len(pts) >= 3:
-        pl.close(True)
-    return pl
-
-def first_finite(*vals, default=0.0):
-    for v in vals:
-        # treat None / '' as missing
-        if v is None or v == '':
-            continue
-        try:
-            x = float(v)
-        except (TypeError, ValueError):
+import numpy as np
+import pandas as pd
+import shapely
+from .geometry import vertex_arrays, tin_from_points
+from .dxfstream import StreamingDXFWriter
+from .cancel import check
+from .features import FeatureTable
+
+BATCH_SIZE = 10000 # géométries traitées par lot
+
+def _add_polylines(msp, geoms, z, layer, close_polylines=True, batch_size=BATCH_SIZE, compact=False, cancel=None):
+    """
+    Write every ring/line of `geoms` on `layer`; returns the count. Each sequence sits at
+    a single Z, so with `compact=True` it is written as an LWPOLYLINE carrying that Z as
+    its elevation instead of a POLYLINE with one VERTEX entity per point.
+    Geometries are expected valid already (see geometry.repair_layer).
+    """
+    z = np.broadcast_to(np.asarray(z, dtype=float), (len(geoms),))
+    n = 0
+    # in batches, so a streaming target only ever holds one batch of vertices
+    for i in range(0, len(geoms), batch_size):
+        check(cancel)
+        arrays, is_ring = vertex_arrays(geoms[i:i + batch_size], z[i:i + batch_size])
+        for pts, ring in zip(arrays, is_ring):
+            close = bool(close_polylines and ring and len(pts) >= 3)
+            if compact:
+                msp.add_lwpolyline(pts[:, :2].tolist(), close=close,
+                                   dxfattribs={"layer": layer, "elevation": float(pts[0, 2])})
+            else:
+                msp.add_polyline3d(pts.tolist(), close=close, dxfattribs={"layer": layer})
+        n += len(arrays)
+    return n
+
+def _geometries(layer):
+    """What _add_polylines iterates: the FeatureTable itself (read from its arrays) or the geometry array."""
+    return layer if isinstance(layer, FeatureTable) else layer.geometry.values
+
+def coalesce_z(df, columns, default=0.0):
+    """Per row, the first finite numeric value among `columns`, else `default` (None, '' and text are missing)."""
+    z = np.full(len(df), np.nan)
+    for c in columns:
+        if c not in df:
             continue
-        if math.isfinite(x):
-            return x
-    return default
+        v = df[c]  # a FeatureTable column is a plain array, float already when numeric
+        if not (isinstance(v, np.ndarray) and v.dtype.kind == "f"):
+            v = pd.to_numeric(pd.Series(v), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        z = np.where(np.isfinite(z), z, v)
+    z[~np.isfinite(z)] = default
+    return z
 
 def add_paperspace_note(doc, address, target_epsg):
     try:
@@ -54,88 +62,141 @@ def add_paperspace_note(doc, address, target_epsg):
         mtext.set_location((10,145))
     except: pass
 
-def write_dxf_two_layers(
-    gdf_b, gdf_p, gdf_alti, out_path,
-    layer_building="Batiment", layer_parcelle="Parcelle", layer_point_alti="Point_Altimetrique",
-    close_polylines=True, address_for_note="", target_epsg_for_note="", point_alti=True
-    ):
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+def new_document(layer_building="Batiment", layer_parcelle="Parcelle", layer_point_alti="Point_Altimetrique", point_alti=True,
+                 streaming_path=None, layer_tin=None, layer_contour=None):
+    """
+    An ezdxf R2018 document, or with `streaming_path` a StreamingDXFWriter that writes
+    its tables right away and every entity as it is added.
+    """
+    if streaming_path is not None:
+        layers = {layer_building: 13, layer_parcelle: 153}
+        if point_alti: layers[layer_point_alti] = 106
+        if layer_tin: layers[layer_tin] = 96
+        if layer_contour: layers[layer_contour] = 30
+        return StreamingDXFWriter(streaming_path, layers)
     doc = ezdxf.new("R2018")
-    msp = doc.modelspace()
 
     # layers & header
     if layer_building not in doc.layers: doc.layers.add(name=layer_building, color=13)
     if layer_parcelle not in doc.layers: doc.layers.add(name=layer_parcelle, color=153)
     if layer_point_alti not in doc.layers and point_alti: doc.layers.add(name=layer_point_alti, color=106)
+    if layer_tin and layer_tin not in doc.layers: doc.layers.add(name=layer_tin, color=96)
+    if layer_contour and layer_contour not in doc.layers: doc.layers.add(name=layer_contour, color=30)
     doc.header["$INSUNITS"] = 6   # meters
     doc.header["$MEASUREMENT"] = 1
     if "BDTOPO" not in doc.appids: doc.appids.add("BDTOPO")
+    return doc
 
-    n_build = n_parc = n_pt = 0
-
-    # --- Buildings (Polygon/MultiPolygon expected) ---
-    if gdf_b is not None and not gdf_b.empty:
-        for _, row in gdf_b.iterrows():
-            geom = fix_geom(row.geometry)
-            if geom is None or geom.is_empty:
-                continue
-            if point_alti :
-                z = first_finite(
-                        row.get("altitude_maximale_toit"),
-                        row.get("altitude_minimale_toit"),
-                        row.get("hauteur"),
-                        default=0.0
-                    )
-            else :
-                z = first_finite(row.get("hauteur"), default=0.0)
-            if not math.isfinite(z):
-                z = 0.0
-            for pts in polygon_to_3d_polylines(geom, z):
-                pl = _safe_add_polyline3d(msp, pts, layer_building, close=(close_polylines and len(pts) >= 3))
-                if pl is None:
-                    continue
-#                try:
-#                    pl.set_xdata("BDTOPO", [(1000, "hauteur_m"), (1040, float(z))])
-#                except ezdxf.DXFError:
-#                    pass
-                n_build += 1
-
-    # --- Parcelles (Polygon/MultiPolygon expected) ---
-    if gdf_p is not None and not gdf_p.empty:
-        for _, row in gdf_p.iterrows():
-            geom = fix_geom(row.geometry)
-            if geom is None or geom.is_empty:
-                continue
-            for pts in polygon_to_3d_polylines(geom, 0.0):
-                pl = _safe_add_polyline3d(msp, pts, layer_parcelle, close=(close_polylines and len(pts) >= 3))
-                if pl is None:
-                    continue
-                n_parc += 1
-
-    # --- Courbes de niveau (LineString/MultiLineString expected) ---
+def add_buildings(msp, gdf_b, layer_building="Batiment", close_polylines=True, point_alti=True, compact=False,
+                  cancel=None):
+    """Buildings (Polygon/MultiPolygon expected). Returns the number of polylines written."""
+    if gdf_b is None or gdf_b.empty:
+        return 0
     if point_alti :
-        if gdf_alti is not None and not getattr(gdf_alti, "empty", True):
-            for _, row in gdf_alti.iterrows():
-                geom = fix_geom(row.geometry)
-                if geom is None or geom.is_empty:
-                    continue
-                z = first_finite(row.get("z"), default=0.0)
-                if z == -99999.0 :
-                    continue
-                # polygon_to_3d_polylines must support LineString/MultiLineString
-                if geom.geom_type == "Point" :
-                    x,y = geom.x, geom.y
-                    pl = msp.add_point((x,y,z), dxfattribs={"layer": layer_point_alti})  # never close contours
-                else :
-                    continue
-#                    try:
-#                        pl.set_xdata("BDTOPO", [(1000, "altitude_m"), (1040, float(z))])
-#                    except ezdxf.DXFError:
-#                        pass
-                n_pt += 1
+        z = coalesce_z(gdf_b, ["altitude_maximale_toit", "altitude_minimale_toit", "hauteur"])
+    else :
+        z = coalesce_z(gdf_b, ["hauteur"])
+    return _add_polylines(msp, _geometries(gdf_b), z, layer_building, close_polylines, compact=compact,
+                          cancel=cancel)
+
+def add_parcelles(msp, gdf_p, layer_parcelle="Parcelle", close_polylines=True, compact=False, cancel=None):
+    """Parcelles (Polygon/MultiPolygon expected). Returns the number of polylines written."""
+    if gdf_p is None or gdf_p.empty:
+        return 0
+    return _add_polylines(msp, _geometries(gdf_p), 0.0, layer_parcelle, close_polylines, compact=compact,
+                          cancel=cancel)
 
+def add_points_alti(msp, gdf_alti, layer_point_alti="Point_Altimetrique", cancel=None):
+    """Elevation samples (Point expected). Returns the number of points written."""
+    if gdf_alti is None or getattr(gdf_alti, "empty", True):
+        return 0
+    geoms = np.asarray(gdf_alti.geometry.values, dtype=object)
+    is_pt = shapely.get_type_id(geoms) == 0
+    z = coalesce_z(gdf_alti, ["z"])[is_pt]
+    xy = shapely.get_coordinates(geoms[is_pt])
+    ok = np.isfinite(xy).all(axis=1) & (z != -99999.0)
+    xyz = np.column_stack([xy[ok], z[ok]])
+    attribs = {"layer": layer_point_alti}
+    for i in range(0, len(xyz), BATCH_SIZE):
+        check(cancel)
+        if isinstance(msp, StreamingDXFWriter):
+            msp.add_points(xyz[i:i + BATCH_SIZE], layer_point_alti)
+        else:
+            for p in xyz[i:i + BATCH_SIZE].tolist():
+                msp.add_point(p, dxfattribs=attribs)
+    return len(xyz)
+
+def add_contours(msp, gdf_contours, layer_contour="Courbes_de_niveau", compact=False, cancel=None):
+    """Contour lines (LineString with a `z` column), each written at its level."""
+    if gdf_contours is None or gdf_contours.empty:
+        return 0
+    z = coalesce_z(gdf_contours, ["z"])
+    return _add_polylines(msp, _geometries(gdf_contours), z, layer_contour, close_polylines=False, compact=compact,
+                          cancel=cancel)
+
+def add_tin_alti(msp, gdf_alti, layer_tin="TIN_Altimetrique", extent=None, mode="mesh"):
+    """
+    Triangulate the elevation samples and write them as one shared-vertex MESH
+    (`mode="mesh"`) or as 3DFACE entities (`mode="3dface"`, always used when streaming
+    R12, which has no MESH). Returns (vertices, faces) written.
+    """
+    if gdf_alti is None or getattr(gdf_alti, "empty", True):
+        return 0, 0
+    geoms = np.asarray(gdf_alti.geometry.values, dtype=object)
+    is_pt = shapely.get_type_id(geoms) == 0
+    z = coalesce_z(gdf_alti, ["z"])[is_pt]
+    xyz = np.column_stack([shapely.get_coordinates(geoms[is_pt]), z])
+    xyz = xyz[z != -99999.0]
+    verts, faces = tin_from_points(xyz, extent)
+    if len(faces) == 0:
+        return 0, 0
+    if mode == "mesh" and not isinstance(msp, StreamingDXFWriter):
+        mesh = msp.add_mesh(dxfattribs={"layer": layer_tin})
+        with mesh.edit_data() as md:
+            md.vertices = verts.tolist()
+            md.faces = faces.tolist()
+    else:
+        attribs = {"layer": layer_tin}
+        for tri in verts[faces].tolist():
+            msp.add_3dface(tri, dxfattribs=attribs)
+    return len(verts), len(faces)
+
+def save_document(doc, out_path, address_for_note="", target_epsg_for_note="", binary=False):
+    """Write the document (binary DXF with `binary=True`, not available when streaming)."""
+    if isinstance(doc, StreamingDXFWriter):
+        if binary:
+            raise ValueError("Le DXF binaire n'est pas disponible en mode streaming.")
+        doc.close(address_for_note, target_epsg_for_note)
+        return
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
     if address_for_note or target_epsg_for_note:
         add_paperspace_note(doc, address_for_note, target_epsg_for_note)
+    doc.saveas(out_path, fmt="bin" if binary else "asc")
+
+def discard_document(doc):
+    """Drop a document that will not be saved (removes a partly streamed file)."""
+    if isinstance(doc, StreamingDXFWriter):
+        doc.discard()
+
+def write_dxf_two_layers(
+    gdf_b, gdf_p, gdf_alti, out_path,
+    layer_building="Batiment", layer_parcelle="Parcelle", layer_point_alti="Point_Altimetrique",
+    close_polylines=True, address_for_note="", target_epsg_for_note="", point_alti=True,
+    streaming=False, compact=False, binary=False, cancel=None
+    ):
+    """Write the three layers to `out_path`; building and parcel layers must be repaired already (repair_layer)."""
+    doc = new_document(layer_building, layer_parcelle, layer_point_alti, point_alti,
+                       streaming_path=out_path if streaming else None)
+    msp = doc.modelspace()
+
+    try:
+        n_build = add_buildings(msp, gdf_b, layer_building, close_polylines, point_alti, compact, cancel)
+        n_parc = add_parcelles(msp, gdf_p, layer_parcelle, close_polylines, compact, cancel)
+        n_pt = add_points_alti(msp, gdf_alti, layer_point_alti, cancel) if point_alti else 0
+        check(cancel)
+    except BaseException:
+        discard_document(doc)
+        raise
 
-    doc.saveas(out_path)
+    save_document(doc, out_path, address_for_note, target_epsg_for_note, binary)
     return n_build, n_parc, n_pt
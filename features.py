@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.features
+Columnar container for WFS layers: one flat (V, 2) coordinate array with
+ring, part and geometry offset arrays (the GeoArrow layout, every geometry
+stored as a multi-geometry) and one typed NumPy array per attribute.
+Built straight from the GeoJSON, without a shapely object or a pandas row
+per feature, and consumed as is by crsmap.reproject and the DXF writer;
+shapely geometries and GeoDataFrames are produced on demand.
+"""
+
+import json
+
+import numpy as np
+import shapely
+from shapely import GeometryType
+
+try:  # optional, several times faster than json on large pages
+    import orjson
+except ImportError:
+    orjson = None
+
+POINT, LINE, POLYGON = 0, 1, 2  # FeatureTable.kinds; -1 = no geometry
+
+
+def loads(data):
+    """Parse JSON bytes/str, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def _typed(values):
+    """float64 array if every value is numeric or missing (missing -> NaN), else an object array."""
+    if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return out
+
+
+def _missing(like, n):
+    if like.dtype == object:
+        return np.full(n, None, dtype=object)
+    return np.full(n, np.nan)
+
+
+def _gather(offsets, idx):
+    """Ragged take: new offsets and the element indices of the rows `idx`."""
+    starts, ends = offsets[idx], offsets[idx + 1]
+    counts = ends - starts
+    new = np.zeros(len(idx) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new[1:])
+    return new, np.repeat(starts - new[:-1], counts) + np.arange(new[-1])
+
+
+def _parts(c, t):
+    """GeoJSON coordinates as parts of rings of positions, plus the kind."""
+    if t == "Polygon":
+        return (c,), POLYGON
+    if t == "MultiPolygon":
+        return c, POLYGON
+    if t == "LineString":
+        return ((c,),), LINE
+    if t == "MultiLineString":
+        return [(line,) for line in c], LINE
+    if t == "Point":
+        return ((((c,),),) if len(c) else ()), POINT
+    if t == "MultiPoint":
+        return [((p,),) for p in c if len(p)], POINT
+    return (), -1
+
+
+class FeatureBuilder:
+    """Accumulates GeoJSON features (one page or one batch at a time) into a FeatureTable."""
+    def __init__(self, crs=None, columns=None):
+        self.crs = crs
+        self.wanted = None if columns is None else set(columns)
+        self.coords = []
+        self.ring_offsets = [0]
+        self.part_offsets = [0]
+        self.geom_offsets = [0]
+        self.kinds = []
+        self.ids = []
+        self.props = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, feature):
+        g = feature.get("geometry") or {}
+        parts, kind = _parts(g.get("coordinates") or [], g.get("type"))
+        coords, rings = self.coords, self.ring_offsets
+        n_parts = len(self.part_offsets)
+        for part in parts:
+            # GEOS cannot build a part without its exterior ring/line: empty ones are left out
+            if not len(part) or not len(part[0]):
+                continue
+            for ring in part:
+                if len(ring):
+                    coords.extend(ring)
+                    rings.append(len(coords))
+            self.part_offsets.append(len(rings) - 1)
+        self.geom_offsets.append(len(self.part_offsets) - 1)
+        i = len(self.kinds)
+        # an empty geometry is stored as a missing one
+        self.kinds.append(kind if len(self.part_offsets) > n_parts else -1)
+        self.ids.append(feature.get("id"))
+        for k, v in (feature.get("properties") or {}).items():
+            if self.wanted is None or k in self.wanted:
+                self.props.setdefault(k, {})[i] = v
+
+    def extend(self, features):
+        for f in features:
+            self.add(f)
+        return self
+
+    def table(self) -> "FeatureTable":
+        n = len(self.kinds)
+        try:
+            xy = np.array(self.coords, dtype=float).reshape(len(self.coords), -1)[:, :2]
+        except ValueError:  # 2D and 3D positions mixed
+            xy = np.array([c[:2] for c in self.coords], dtype=float).reshape(-1, 2)
+        columns = {k: _typed([col.get(i) for i in range(n)]) for k, col in self.props.items()}
+        ids = np.empty(n, dtype=object)
+        ids[:] = self.ids
+        return FeatureTable(xy, np.asarray(self.ring_offsets, dtype=np.int64),
+                            np.asarray(self.part_offsets, dtype=np.int64),
+                            np.asarray(self.geom_offsets, dtype=np.int64),
+                            np.asarray(self.kinds, dtype=np.int8), columns, self.crs, ids)
+
+
+class FeatureTable:
+    """
+    n features: kinds (n,), geom_offsets (n+1,) into the parts, part_offsets into the
+    rings, ring_offsets into coords (V, 2). A polygon part is its exterior ring then its
+    holes; a line part is one ring; a point part is one ring of one position.
+    The shapely geometries are built at most once per table (see geometries()).
+    """
+    def __init__(self, coords, ring_offsets, part_offsets, geom_offsets, kinds, columns=None, crs=None, ids=None):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.geom_offsets = geom_offsets
+        self.kinds = kinds
+        self.columns = dict(columns or {})
+        self.crs = crs
+        self.ids = ids if ids is not None else np.full(len(kinds), None, dtype=object)
+        self._geometries = None
+
+    # -------- construction --------
+    @classmethod
+    def empty_table(cls, crs=None, columns=()):
+        z = np.zeros(1, dtype=np.int64)
+        return cls(np.empty((0, 2)), z, z, z, np.empty(0, dtype=np.int8),
+                   {c: np.empty(0) for c in columns}, crs)
+
+    @classmethod
+    def from_features(cls, features, crs=None, columns=None) -> "FeatureTable":
+        """From GeoJSON feature dicts; `columns` restricts the properties kept."""
+        return FeatureBuilder(crs, columns).extend(features).table()
+
+    @classmethod
+    def from_geojson(cls, data, crs=None, columns=None) -> "FeatureTable":
+        """From a GeoJSON FeatureCollection as bytes or str."""
+        return cls.from_features(loads(data).get("features", []), crs, columns)
+
+    @classmethod
+    def from_geometries(cls, geoms, columns=None, crs=None, ids=None) -> "FeatureTable":
+        """
+        From an array of shapely geometries (vectorized, shapely.to_ragged_array per
+        geometry family). Missing and empty geometries and GeometryCollections get no parts.
+        """
+        geoms = np.asarray(geoms, dtype=object)
+        n = len(geoms)
+        types = shapely.get_type_id(geoms)
+        kinds = np.full(n, -1, dtype=np.int8)
+        kinds[np.isin(types, (0, 4))] = POINT
+        kinds[np.isin(types, (1, 2, 5))] = LINE
+        kinds[np.isin(types, (3, 6))] = POLYGON
+        kinds[shapely.is_empty(geoms)] = -1
+        pieces, rows = [], []
+        for kind in (POINT, LINE, POLYGON):
+            sel = np.flatnonzero(kinds == kind)
+            if len(sel):
+                pieces.append(cls._from_family(geoms[sel], kind))
+                rows.append(sel)
+        none = np.flatnonzero(kinds < 0)
+        if len(none):
+            z = np.zeros(len(none) + 1, dtype=np.int64)
+            pieces.append(cls(np.empty((0, 2)), z[:1], z[:1], z, np.full(len(none), -1, dtype=np.int8)))
+            rows.append(none)
+        out = cls.concat(pieces) if pieces else cls.empty_table()
+        if len(rows) > 1:
+            out = out.take(np.argsort(np.concatenate(rows), kind="stable"))
+        out.columns = dict(columns or {})
+        out.crs = crs
+        if ids is not None:
+            out.ids = ids
+        return out
+
+    @classmethod
+    def _from_family(cls, geoms, kind):
+        gtype, coords, offsets = shapely.to_ragged_array(geoms, include_z=False)
+        n = len(geoms)
+        seq = lambda k: np.arange(k + 1, dtype=np.int64)
+        if gtype == GeometryType.POINT:
+            rings = parts = gs = seq(n)
+        elif gtype == GeometryType.MULTIPOINT:
+            rings, parts, gs = seq(len(coords)), seq(len(coords)), offsets[0]
+        elif gtype == GeometryType.LINESTRING:
+            rings, parts, gs = offsets[0], seq(n), seq(n)
+        elif gtype == GeometryType.MULTILINESTRING:
+            rings, parts, gs = offsets[0], seq(len(offsets[0]) - 1), offsets[1]
+        elif gtype == GeometryType.POLYGON:
+            rings, parts, gs = offsets[0], offsets[1], seq(n)
+        else:
+            rings, parts, gs = offsets
+        return cls(np.asarray(coords, dtype=float), np.asarray(rings, dtype=np.int64),
+                   np.asarray(parts, dtype=np.int64), np.asarray(gs, dtype=np.int64),
+                   np.full(n, kind, dtype=np.int8))
+
+    @classmethod
+    def concat(cls, tables) -> "FeatureTable":
+        tables = list(tables)
+        if not tables:
+            return cls.empty_table()
+        if len(tables) == 1:
+            return tables[0]
+        names = list(dict.fromkeys(k for t in tables for k in t.columns))
+        columns = {}
+        for k in names:
+            like = next(t.columns[k] for t in tables if k in t.columns)
+            columns[k] = np.concatenate([t.columns[k] if k in t.columns else _missing(like, len(t)) for t in tables])
+        rings, parts, geoms = [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)]
+        nv = nr = np_ = 0
+        for t in tables:
+            rings.append(t.ring_offsets[1:] + nv)
+            parts.append(t.part_offsets[1:] + nr)
+            geoms.append(t.geom_offsets[1:] + np_)
+            nv += len(t.coords)
+            nr += len(t.ring_offsets) - 1
+            np_ += len(t.part_offsets) - 1
+        out = cls(np.concatenate([t.coords for t in tables]), np.concatenate(rings), np.concatenate(parts),
+                  np.concatenate(geoms), np.concatenate([t.kinds for t in tables]), columns, tables[0].crs,
+                  np.concatenate([t.ids for t in tables]))
+        if all(t._geometries is not None for t in tables):
+            out._geometries = np.concatenate([t._geometries for t in tables])
+        return out
+
+    # -------- access --------
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.kinds) == 0
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, key):
+        """A column by name, or the rows selected by a slice, mask or index array."""
+        if isinstance(key, str):
+            return self.columns[key]
+        return self.take(key)
+
+    def take(self, idx) -> "FeatureTable":
+        n = len(self)
+        if isinstance(idx, slice):
+            if idx.indices(n) == (0, n, 1):
+                return self
+            idx = np.arange(n)[idx]
+        idx = np.asarray(idx)
+        if idx.dtype == bool:
+            idx = np.flatnonzero(idx)
+        geom_offsets, parts = _gather(self.geom_offsets, idx)
+        part_offsets, rings = _gather(self.part_offsets, parts)
+        ring_offsets, verts = _gather(self.ring_offsets, rings)
+        out = FeatureTable(self.coords[verts], ring_offsets, part_offsets, geom_offsets, self.kinds[idx],
+                           {k: v[idx] for k, v in self.columns.items()}, self.crs, self.ids[idx])
+        if self._geometries is not None:
+            out._geometries = self._geometries[idx]
+        return out
+
+    def drop_duplicate_ids(self) -> "FeatureTable":
+        """Keep the first row of each feature id (rows without an id are all kept), in order."""
+        has = np.array([i is not None for i in self.ids], dtype=bool)
+        if not has.any():
+            return self
+        _, first = np.unique(self.ids[has].astype(str), return_index=True)
+        if len(first) == has.sum():
+            return self
+        keep = ~has
+        keep[np.flatnonzero(has)[first]] = True
+        return self.take(keep)
+
+    def select(self, spec) -> "FeatureTable":
+        """
+        Keep and rename columns: `spec` maps each output name to the accepted source
+        names (matched case-insensitively, first present wins); absent ones are NaN.
+        """
+        lower = {k.lower(): k for k in reversed(list(self.columns))}
+        columns = {}
+        for name, aliases in spec.items():
+            src = next((lower[a.lower()] for a in aliases if a.lower() in lower), None)
+            columns[name] = self.columns[src] if src is not None else np.full(len(self), np.nan)
+        out = FeatureTable(self.coords, self.ring_offsets, self.part_offsets, self.geom_offsets, self.kinds,
+                           columns, self.crs, self.ids)
+        out._geometries = self._geometries
+        return out
+
+    def sequences(self):
+        """
+        Every ring/line as a vertex sequence, for geometry.vertex_arrays: (xy, sequence of
+        each vertex, sequence is a polygon ring, geometry of each sequence).
+        """
+        n_rings = len(self.ring_offsets) - 1
+        part_geom = np.repeat(np.arange(len(self)), np.diff(self.geom_offsets))
+        ring_geom = np.repeat(part_geom, np.diff(self.part_offsets))
+        vseq = np.repeat(np.arange(n_rings), np.diff(self.ring_offsets))
+        return self.coords, vseq, self.kinds[ring_geom] == POLYGON, ring_geom
+
+    def bounds(self) -> np.ndarray:
+        """(n, 4) minx, miny, maxx, maxy of each row, read from the coordinate array; NaN where missing."""
+        out = np.full((len(self), 4), np.nan)
+        vertex_offsets = self.ring_offsets[self.part_offsets[self.geom_offsets]]
+        has = np.diff(vertex_offsets) > 0
+        if has.any():
+            starts = vertex_offsets[:-1][has]
+            out[has, :2] = np.minimum.reduceat(self.coords, starts, axis=0)
+            out[has, 2:] = np.maximum.reduceat(self.coords, starts, axis=0)
+        return out
+
+    def in_bbox(self, bbox) -> np.ndarray:
+        """Mask of the rows whose envelope meets `bbox` (minx, miny, maxx, maxy), without building geometries."""
+        b = self.bounds()
+        return (b[:, 0] <= bbox[2]) & (b[:, 2] >= bbox[0]) & (b[:, 1] <= bbox[3]) & (b[:, 3] >= bbox[1])
+
+    # -------- conversions --------
+    def geometries(self) -> np.ndarray:
+        """
+        shapely geometries (single-part ones as Polygon/LineString/Point), None where missing.
+        Built on the first call and kept: the array is shared, callers must not modify it.
+        """
+        if self._geometries is None:
+            self._geometries = self._build_geometries()
+        return self._geometries
+
+    def _build_geometries(self) -> np.ndarray:
+        out = np.full(len(self), None, dtype=object)
+        for kind, gtype in ((POINT, GeometryType.MULTIPOINT), (LINE, GeometryType.MULTILINESTRING),
+                            (POLYGON, GeometryType.MULTIPOLYGON)):
+            sel = np.flatnonzero(self.kinds == kind)
+            if not len(sel):
+                continue
+            t = self if len(sel) == len(self) else self.take(sel)
+            if kind == POLYGON:
+                offsets = (t.ring_offsets, t.part_offsets, t.geom_offsets)
+            elif kind == LINE:
+                offsets = (t.ring_offsets, t.part_offsets[t.geom_offsets])
+            else:
+                offsets = (t.ring_offsets[t.part_offsets[t.geom_offsets]],)
+            geoms = shapely.from_ragged_array(gtype, t.coords, offsets)
+            single = shapely.get_num_geometries(geoms) == 1
+            geoms[single] = shapely.get_geometry(geoms[single], 0)
+            out[sel] = geoms
+        return out
+
+    def replace_geometries(self, geoms) -> "FeatureTable":
+        """Same rows and attributes with new geometries (e.g. repaired or clipped)."""
+        geoms = np.asarray(geoms, dtype=object)
+        out = FeatureTable.from_geometries(geoms, self.columns, self.crs, self.ids)
+        out._geometries = geoms
+        return out
+
+    def to_crs(self, dst) -> "FeatureTable":
+        """Reprojected copy: one transform call over the flat coordinate array."""
+        from .crsmap import get_transformer, same_crs
+        if self.crs is None or same_crs(self.crs, dst):
+            return self
+        x, y = get_transformer(self.crs, dst).transform(self.coords[:, 0], self.coords[:, 1])
+        return FeatureTable(np.column_stack([x, y]), self.ring_offsets, self.part_offsets, self.geom_offsets,
+                            self.kinds, self.columns, dst, self.ids)
+
+    def to_geodataframe(self):
+        import geopandas as gpd
+        return gpd.GeoDataFrame(dict(self.columns), geometry=self.geometries(), crs=self.crs)
@@ -1,12 +1,27 @@
-from dataclasses import dataclass
-from typing import List, Union, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import List, Union, Optional, Sequence
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
 import requests
-from .config import USER_AGENT, TIMEOUT
+from . import transport
+from .config import (TIMEOUT, GEOCODE_URL, CACHE_DIR, GEOCODE_CACHE_SIZE, GEOCODE_TTL_S, SUGGEST_LIMIT,
+                     GEOCODE_BATCH_ROWS, GEOCODE_BATCH_MIN_ROWS, GEOCODE_BATCH_TIMEOUT, GEOCODE_MIN_SCORE,
+                     GEOCODE_FALLBACK_WORKERS)
 
-ADDOK_URL = 'https://data.geopf.fr/geocodage/search'
+ADDOK_URL = GEOCODE_URL
+ADDOK_CSV_URL = ADDOK_URL + '/csv'
 
-session = requests.Session()
-session.headers.update({"User-Agent": USER_AGENT})
+# a re-sent upload would geocode the whole file again: geocode_batch splits the chunk instead
+transport.mount_single_post(ADDOK_CSV_URL)
 
 @dataclass
 class Address:
@@ -16,14 +31,92 @@ class Address:
     postcode: str
     citycode: str
 
-def geocode(address: str, limit: int = 20) -> Optional[Union[Address, List[str]]]:
-    params = {'q': address, 'limit': limit}
-    r = session.get(ADDOK_URL, params=params, timeout=TIMEOUT)
+@dataclass
+class GeocodeResult:
+    """One row of geocode_batch: status is "ok" (batch answer), "fallback" (single query), "low-score", "not-found" or "error"."""
+    query: str
+    address: Optional[Address]
+    status: str
+    score: float = 0.0
+    error: str = ""
+
+def normalize_query(q: str) -> str:
+    """Cache key of a query: case, accents, punctuation and spacing do not change the answer."""
+    q = unicodedata.normalize("NFKD", q or "")
+    q = "".join(c for c in q if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"\W+", " ", q).split())
+
+
+class GeocodeCache:
+    """
+    Answers of the geocoder keyed by normalized query: an in-memory LRU in front
+    of a small SQLite table, so a query typed again (even spelled slightly
+    differently) never goes back to the network. Thread-safe.
+    """
+    def __init__(self, path=None, max_entries=GEOCODE_CACHE_SIZE, ttl=GEOCODE_TTL_S):
+        self.path = path or os.path.join(CACHE_DIR, "geocode.sqlite")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, payload TEXT NOT NULL, updated REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key) -> Optional[List[Address]]:
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                return self._mem[key]
+        with self._connect() as c:
+            row = c.execute("SELECT payload, updated FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        found = [Address(**a) for a in json.loads(row[0])]
+        self._remember(key, found)
+        return found
+
+    def put(self, key, found: List[Address]):
+        self._remember(key, found)
+        with self._connect() as c:
+            c.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?)",
+                      (key, json.dumps([asdict(a) for a in found]), time.time()))
+
+    def _remember(self, key, found):
+        with self._lock:
+            self._mem[key] = found
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+
+_default_cache = None
+
+def default_geocode_cache() -> GeocodeCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GeocodeCache()
+    return _default_cache
+
+
+def _cache_key(address, limit, extra):
+    return ":".join([str(limit), *(f"{k}={v}" for k, v in sorted(extra.items())), normalize_query(address)])
+
+def _search(address: str, limit: int, cache: Optional[GeocodeCache] = None, **extra) -> List[Address]:
+    """All candidates for `address`, best first (cached by normalized query and parameters)."""
+    key = _cache_key(address, limit, extra)
+    if cache is not None:
+        found = cache.get(key)
+        if found is not None:
+            return found
+    params = {'q': address, 'limit': limit, **extra}
+    r = transport.get(ADDOK_URL, params=params, timeout=TIMEOUT)
     r.raise_for_status()
     data = r.json()
     feats = data.get("features", [])
-    if not feats:
-        return None
     feats.sort(key=lambda f: (-f["properties"]["score"], -float(f["properties"].get("importance", 0))))
     results = []
     for f in feats:
@@ -35,4 +128,112 @@ def geocode(address: str, limit: int = 20) -> Optional[Union[Address, List[str]]
             postcode=props.get("postcode",""),
             citycode=props.get("citycode",""),
         ))
+    if cache is not None:
+        cache.put(key, results)
+    return results
+
+def geocode(address: str, limit: int = 20, cache: Optional[GeocodeCache] = None) -> Optional[Union[Address, List[Address]]]:
+    results = _search(address, limit, cache)
+    if not results:
+        return None
     return results[0] if len(results) == 1 else results
+
+def suggest(prefix: str, limit: int = SUGGEST_LIMIT, cache: Optional[GeocodeCache] = None) -> List[Address]:
+    """Type-ahead candidates for a partially typed address."""
+    return _search(prefix, limit, cache, autocomplete=1)
+
+
+def _csv_search(queries, postcodes):
+    """One upload to the CSV batch endpoint; returns the result rows in input order."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["rid", "q", "postcode"])
+    for i, (q, pc) in enumerate(zip(queries, postcodes)):
+        w.writerow([i, q, pc])
+    fields = [("columns", "q")]
+    if any(postcodes):
+        fields.append(("postcode", "postcode"))
+    r = transport.post(ADDOK_CSV_URL, data=fields, timeout=GEOCODE_BATCH_TIMEOUT,
+                     files={"data": ("adresses.csv", buf.getvalue().encode("utf-8"), "text/csv")})
+    r.raise_for_status()
+    rows = {}
+    for row in csv.DictReader(io.StringIO(r.content.decode("utf-8-sig"))):
+        rows[int(row["rid"])] = row
+    return [rows.get(i, {}) for i in range(len(queries))]
+
+def _result_from_row(query, row, min_score) -> GeocodeResult:
+    try:
+        score = float(row.get("result_score") or 0.0)
+    except ValueError:
+        score = 0.0
+    status = row.get("result_status") or ("ok" if row.get("result_label") else "not-found")
+    if status != "ok" or score < min_score or not row.get("longitude"):
+        return GeocodeResult(query, None, status if status != "ok" else "low-score", score)
+    addr = Address(label=row["result_label"], lon=float(row["longitude"]), lat=float(row["latitude"]),
+                   postcode=row.get("result_postcode", ""), citycode=row.get("result_citycode", ""))
+    return GeocodeResult(query, addr, "ok", score)
+
+def geocode_batch(queries: Sequence[str], postcodes: Optional[Sequence[str]] = None,
+                  cache: Optional[GeocodeCache] = None, min_score: float = GEOCODE_MIN_SCORE,
+                  chunk_rows: int = GEOCODE_BATCH_ROWS, min_chunk_rows: int = GEOCODE_BATCH_MIN_ROWS
+                  ) -> List[GeocodeResult]:
+    """
+    Geocode a whole list of addresses with one upload to the CSV batch endpoint per
+    `chunk_rows` rows (best candidate only, optionally restricted to a postcode).
+    An upload that times out is sent again as two halves, down to `min_chunk_rows`.
+    Answers scoring under `min_score` are "low-score" and unanswered rows "not-found",
+    as the regular search of the same geocoder would say the same; only rows of a chunk
+    whose upload failed, or that the batch could not process, are retried one by one.
+    Answers are shared with the single-query cache.
+    """
+    postcodes = [str(p or "") for p in (postcodes or [""] * len(queries))]
+    results: List[Optional[GeocodeResult]] = [None] * len(queries)
+    todo = []
+    for i, (q, pc) in enumerate(zip(queries, postcodes)):
+        extra = {"postcode": pc} if pc else {}
+        found = cache.get(_cache_key(q, 1, extra)) if cache is not None else None
+        if found:
+            results[i] = GeocodeResult(q, found[0], "ok")
+        else:
+            todo.append(i)
+
+    retry = []
+    chunks = [todo[c:c + chunk_rows] for c in range(0, len(todo), chunk_rows)]
+    while chunks:
+        idx = chunks.pop(0)
+        try:
+            rows = _csv_search([queries[i] for i in idx], [postcodes[i] for i in idx])
+        except requests.Timeout:
+            if len(idx) // 2 >= min_chunk_rows:
+                half = len(idx) // 2
+                chunks[:0] = [idx[:half], idx[half:]]
+            else:
+                retry.extend(idx)
+            continue
+        except (requests.RequestException, ValueError, KeyError):
+            retry.extend(idx)
+            continue
+        for i, row in zip(idx, rows):
+            res = results[i] = _result_from_row(queries[i], row, min_score)
+            if res.address is None and res.status not in ("low-score", "not-found"):
+                retry.append(i)
+            elif cache is not None:
+                cache.put(_cache_key(queries[i], 1, {"postcode": postcodes[i]} if postcodes[i] else {}), [res.address])
+
+    def single(i):
+        q, pc = queries[i], postcodes[i]
+        try:
+            found = _search(q, 1, cache, **({"postcode": pc} if pc else {}))
+        except Exception as e:
+            prev = results[i]
+            return GeocodeResult(q, None, "error", prev.score if prev else 0.0, f"{type(e).__name__}: {e}")
+        if not found:
+            prev = results[i]
+            return GeocodeResult(q, None, "not-found", prev.score if prev else 0.0)
+        return GeocodeResult(q, found[0], "fallback")
+
+    if retry:
+        with ThreadPoolExecutor(max_workers=GEOCODE_FALLBACK_WORKERS) as pool:
+            for i, res in zip(retry, pool.map(single, retry)):
+                results[i] = res
+    return results
@@ -1,11 +1,7 @@
+import numpy as np
+import shapely
 from shapely.geometry import Polygon, MultiPolygon, LinearRing, LineString, MultiLineString 
-
-def fix_geom(geom):
-    if geom is None or geom.is_empty: return geom
-    if not geom.is_valid:
-        g2 = geom.buffer(0)
-        if g2.is_valid: return g2
-    return geom
+from .features import FeatureTable
 
 def _ring_points_3d(ring: LinearRing, z: float):
     coords = list(ring.coords)
@@ -37,3 +33,165 @@ def polygon_to_3d_polylines(geom, z):
             polys.extend(polygon_to_3d_polylines(g, z))
     polys = [p for p in polys if len(p) >= 2]
     return polys
+
+
+def _polygonal_parts(geoms):
+    """Keep only the polygon parts of each geometry (make_valid may add lines/points); empty -> None."""
+    parts, idx = shapely.get_parts(geoms, return_index=True)
+    # a GeometryCollection can hold MultiPolygons: flatten one more level
+    parts, sub = shapely.get_parts(parts, return_index=True)
+    idx = idx[sub]
+    poly = shapely.get_type_id(parts) == 3
+    out = np.full(len(geoms), None, dtype=object)
+    if poly.any():
+        kept = np.unique(idx[poly])
+        out[kept] = shapely.multipolygons(parts[poly], indices=np.searchsorted(kept, idx[poly]))
+        single = shapely.get_num_geometries(out[kept]) == 1
+        out[kept[single]] = shapely.get_geometry(out[kept[single]], 0)
+    return out
+
+def repair_geometries(geoms, polygonal=True):
+    """
+    Repair a whole geometry array: one vectorized is_valid pass, then make_valid
+    on the invalid geometries only (buffer(0) can silently drop whole parts of a
+    self-intersecting polygon). With `polygonal`, non-polygon debris left by make_valid
+    is discarded. Returns (geoms, keep mask, number repaired, number dropped);
+    missing/empty geometries and repairs that leave nothing are dropped.
+    """
+    geoms = np.array(geoms, dtype=object)
+    keep = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    bad = keep & ~shapely.is_valid(geoms)
+    if bad.any():
+        fixed = shapely.make_valid(geoms[bad])
+        if polygonal:
+            fixed = _polygonal_parts(fixed)
+        geoms[bad] = fixed
+        keep[bad] = ~(shapely.is_missing(fixed) | shapely.is_empty(fixed))
+    return geoms, keep, int((bad & keep).sum()), int((~keep).sum())
+
+def repair_layer(gdf, polygonal=True):
+    """repair_geometries over a GeoDataFrame (or FeatureTable). Returns (layer, repaired, dropped)."""
+    if gdf is None or gdf.empty:
+        return gdf, 0, 0
+    table = isinstance(gdf, FeatureTable)
+    geoms, keep, n_repaired, n_dropped = repair_geometries(gdf.geometries() if table else gdf.geometry.values,
+                                                           polygonal)
+    if n_repaired == 0 and n_dropped == 0:
+        return gdf, 0, 0
+    if table:
+        return gdf.take(keep).replace_geometries(geoms[keep]), n_repaired, n_dropped
+    out = gdf.set_geometry(gdf.geometry.__class__(geoms, index=gdf.index, crs=gdf.crs, name=gdf.geometry.name))
+    return out[keep], n_repaired, n_dropped
+
+def clip_to_extent(gdf, extent, mode="clip"):
+    """
+    Restrict a layer to the `extent` polygon with one STRtree query: features that do
+    not intersect it are dropped; with mode="clip" those crossing its boundary are cut
+    (polygon layers keep polygon parts only), with mode="filter" they are kept whole.
+    """
+    if gdf is None or gdf.empty or extent is None or not mode:
+        return gdf
+    table = isinstance(gdf, FeatureTable)
+    geoms = gdf.geometries() if table else np.asarray(gdf.geometry.values, dtype=object)
+    tree = shapely.STRtree(geoms)
+    hit = np.sort(tree.query(extent, predicate="intersects"))
+    out = gdf.take(hit) if table else gdf.iloc[hit]
+    if mode != "clip" or len(hit) == 0:
+        return out
+    inside = np.isin(hit, tree.query(extent, predicate="contains"))
+    if inside.all():
+        return out
+    cut = geoms[hit].copy()
+    cut[~inside] = shapely.intersection(cut[~inside], extent)
+    polygonal = np.isin(shapely.get_type_id(geoms[hit]), (3, 6))
+    fix = ~inside & polygonal
+    if fix.any():
+        cut[fix] = _polygonal_parts(cut[fix])
+    keep = ~(shapely.is_missing(cut) | shapely.is_empty(cut))
+    if table:
+        return out.take(keep).replace_geometries(cut[keep])
+    out = out.set_geometry(out.geometry.__class__(cut, index=out.index, crs=out.crs, name=out.geometry.name))
+    return out[keep]
+
+def vertex_arrays(geoms, z):
+    """
+    Bulk equivalent of polygon_to_3d_polylines over a whole geometry array.
+    Polygon rings (exterior then interiors, closing vertex dropped) and LineStrings
+    are returned in input order as (N, 3) arrays at the Z of their geometry, with
+    non-finite vertices and consecutive duplicates removed; sequences left with
+    fewer than 2 vertices are dropped. Returns (list of arrays, is_ring bool array).
+    A FeatureTable is read directly from its coordinate and offset arrays.
+    """
+    if isinstance(geoms, FeatureTable):
+        z = np.broadcast_to(np.asarray(z, dtype=float), (len(geoms),))
+        xy, vseq, seq_ring, seq_geom = geoms.sequences()
+        if len(seq_ring) == 0:
+            return [], np.zeros(0, bool)
+    else:
+        geoms = np.asarray(geoms, dtype=object)
+        z = np.broadcast_to(np.asarray(z, dtype=float), (len(geoms),))
+        parts, part_geom = shapely.get_parts(geoms, return_index=True)
+        types = shapely.get_type_id(parts)
+        poly = types == 3
+        rings, ring_part = shapely.get_rings(parts[poly], return_index=True)
+        lines = parts[types == 1]
+        seqs = np.concatenate([rings, lines])
+        seq_geom = np.concatenate([part_geom[poly][ring_part], part_geom[types == 1]])
+        seq_ring = np.concatenate([np.ones(len(rings), bool), np.zeros(len(lines), bool)])
+        order = np.argsort(seq_geom, kind="stable")
+        seqs, seq_geom, seq_ring = seqs[order], seq_geom[order], seq_ring[order]
+        if len(seqs) == 0:
+            return [], np.zeros(0, bool)
+        xy, vseq = shapely.get_coordinates(seqs, return_index=True)
+
+    counts = np.bincount(vseq, minlength=len(seq_ring))
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    keep = np.ones(len(xy), bool)
+    # drop the closing vertex of rings
+    closed = seq_ring & (counts >= 2)
+    closed[closed] = np.all(xy[starts[closed]] == xy[ends[closed] - 1], axis=1)
+    keep[ends[closed] - 1] = False
+
+    xyz = np.column_stack([xy, z[seq_geom][vseq]])
+    keep &= np.isfinite(xyz).all(axis=1)
+    xyz, vseq = xyz[keep], vseq[keep]
+    # consecutive duplicates inside the same sequence
+    dup = np.zeros(len(xyz), bool)
+    dup[1:] = (vseq[1:] == vseq[:-1]) & np.all(xyz[1:] == xyz[:-1], axis=1)
+    xyz, vseq = xyz[~dup], vseq[~dup]
+
+    counts = np.bincount(vseq, minlength=len(seq_ring))
+    out = np.split(xyz, np.cumsum(counts)[:-1])
+    valid = counts >= 2
+    return [a for a, v in zip(out, valid) if v], seq_ring[valid]
+
+def tin_from_points(xyz, extent=None):
+    """
+    Delaunay triangulation of (N, 3) points in one GEOS call. Returns shared vertices
+    (V, 3) and triangle indices (F, 3); with an `extent` polygon only triangles whose
+    centroid lies inside it are kept (and vertices no triangle uses are dropped).
+    """
+    xyz = np.asarray(xyz, dtype=float)
+    xyz = xyz[np.isfinite(xyz).all(axis=1)]
+    # one vertex per planimetric position
+    key = xyz[:, 0] + 1j * xyz[:, 1]
+    key, first = np.unique(key, return_index=True)
+    xyz = xyz[first]
+    if len(xyz) < 3:
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64)
+
+    tris = shapely.get_parts(shapely.delaunay_triangles(shapely.multipoints(xyz[:, :2])))
+    corners = shapely.get_coordinates(shapely.get_exterior_ring(tris)).reshape(-1, 4, 2)[:, :3]
+    ckey = corners[..., 0] + 1j * corners[..., 1]
+    faces = np.searchsorted(key, ckey)  # `key` is sorted by np.unique
+    faces = np.clip(faces, 0, len(key) - 1)
+    faces = faces[np.all(key[faces] == ckey, axis=1)]
+
+    if extent is not None and len(faces):
+        c = xyz[faces, :2].mean(axis=1)
+        faces = faces[shapely.contains_xy(extent, c[:, 0], c[:, 1])]
+    used = np.unique(faces)
+    remap = np.full(len(xyz), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    return xyz[used], remap[faces]
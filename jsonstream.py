@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.jsonstream
+Incremental readers for the two large JSON bodies of the pipeline: the
+"features" array of a WFS GeoJSON page and the "elevations" array of an
+altimetry answer. They consume the response as byte chunks and produce
+batches straight away, so neither the whole body nor the whole dict tree
+is ever held in memory.
+"""
+
+import re
+
+import numpy as np
+
+from .config import FEATURE_BATCH
+from .features import FeatureBuilder, FeatureTable, loads
+
+_FEATURES = re.compile(rb'"features"\s*:\s*\[')
+# everything up to the next brace, whole strings included (a brace in a string does not count)
+_TO_BRACE = re.compile(rb'(?:[^"{}]+|"(?:[^"\\]+|\\.)*")*', re.S)
+_SEPARATORS = re.compile(rb'[\s,]*')
+
+_BEFORE, _BETWEEN, _INSIDE, _AFTER = range(4)
+
+
+def iter_feature_batches(chunks, batch_size: int = FEATURE_BATCH):
+    """
+    Yield lists of up to `batch_size` feature dicts from the "features" array of a
+    GeoJSON FeatureCollection arriving as byte `chunks`. Only the feature being read
+    and the current batch are kept. A body without a "features" array yields
+    nothing; one cut off inside the array raises ValueError.
+    """
+    buf = b""
+    state, pos, start, depth = _BEFORE, 0, 0, 0
+    batch = []
+    for chunk in chunks:
+        if state == _AFTER:
+            continue  # drain the trailing members (numberMatched, crs ...)
+        buf += chunk
+        while True:
+            if state == _BEFORE:
+                m = _FEATURES.search(buf)
+                if m is None:
+                    buf = buf[-64:]  # the key may straddle two chunks
+                    pos = len(buf)
+                    break
+                state, pos = _BETWEEN, m.end()
+            elif state == _BETWEEN:
+                pos = _SEPARATORS.match(buf, pos).end()
+                if pos >= len(buf):
+                    break
+                c = buf[pos]
+                if c == 0x5D:  # ]
+                    state = _AFTER
+                    break
+                if c != 0x7B:  # {
+                    raise ValueError(f"GeoJSON inattendu : {buf[pos:pos + 20]!r}")
+                state, start, depth = _INSIDE, pos, 0
+            else:
+                pos = _TO_BRACE.match(buf, pos).end()
+                if pos >= len(buf) or buf[pos] == 0x22:  # end of data, or a string cut by the chunk
+                    break
+                depth += 1 if buf[pos] == 0x7B else -1
+                pos += 1
+                if depth == 0:
+                    batch.append(buf[start:pos])
+                    state = _BETWEEN
+                    if len(batch) >= batch_size:
+                        yield loads(b"[" + b",".join(batch) + b"]")
+                        batch = []
+        if state in (_BETWEEN, _INSIDE):
+            cut = start if state == _INSIDE else pos
+            buf, pos, start = buf[cut:], pos - cut, start - cut
+    if state in (_BETWEEN, _INSIDE):
+        raise ValueError("GeoJSON tronqué")
+    if batch:
+        yield loads(b"[" + b",".join(batch) + b"]")
+
+
+def read_feature_table(chunks, crs=None, columns=None, batch_size: int = FEATURE_BATCH) -> FeatureTable:
+    """A whole GeoJSON page as a FeatureTable, converted batch by batch as it arrives."""
+    tables = [FeatureBuilder(crs, columns).extend(b).table() for b in iter_feature_batches(chunks, batch_size)]
+    return FeatureTable.concat(tables) if tables else FeatureTable.empty_table(crs)
+
+
+def read_number_array(chunks, key: str) -> np.ndarray:
+    """
+    The flat array of numbers under `key` (e.g. "elevations") from a JSON object
+    arriving as byte `chunks`, parsed slice by slice into float arrays.
+    Raises ValueError if the array is missing, truncated, or holds anything but numbers.
+    """
+    start = re.compile(rb'"' + re.escape(key.encode()) + rb'"\s*:\s*\[')
+    buf, found, done = b"", False, False
+    parts = []
+    for chunk in chunks:
+        if done:
+            continue
+        buf += chunk
+        if not found:
+            m = start.search(buf)
+            if m is None:
+                buf = buf[-(len(key) + 16):]
+                continue
+            found, buf = True, buf[m.end():]
+        end = buf.find(b"]")
+        if end >= 0:
+            head, buf, done = buf[:end], b"", True
+        else:
+            cut = buf.rfind(b",")
+            if cut < 0:
+                continue
+            head, buf = buf[:cut], buf[cut + 1:]
+        if head.strip():
+            parts.append(np.array(head.split(b","), dtype=float))
+    if not done:
+        raise ValueError(f"tableau {key!r} absent ou tronqué")
+    return np.concatenate(parts) if parts else np.empty(0)
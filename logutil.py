@@ -1,5 +1,5 @@
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler
 import os
 
 def setup_logger(name="cadastre", log_path=None, level=logging.INFO):
@@ -9,10 +9,18 @@ def setup_logger(name="cadastre", log_path=None, level=logging.INFO):
     logger.setLevel(level)
     if log_path is None:
         log_path = os.path.join(os.getcwd(), "cadastre.log")
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
     fh = RotatingFileHandler(log_path, maxBytes=2_000_000, backupCount=3, encoding="utf-8")
     fh.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
     logger.addHandler(fh)
     sh = logging.StreamHandler()
     sh.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
     logger.addHandler(sh)
-    return logger
\ No newline at end of file
+    return logger
+
+def forward_to_queue(queue, name="cadastre", level=logging.INFO):
+    """In a worker process: send the records of `name` to `queue`, read by a QueueListener in the parent."""
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [QueueHandler(queue)]  # not the handlers inherited through fork
+    logger.setLevel(level)
+    logger.propagate = False
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.metrics
+Per-job instrumentation: timing spans (geocoding, every WFS page, every
+altimetry chunk, reprojection, DXF writing) with item and byte counts,
+counters, an opt-in cProfile dump per top-level stage, and a weighted
+progress estimate that drives the UI's percentage bar. Results go to the
+rotating log (logutil) and to a JSON file.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+# share of the progress bar per task (tasks that are never planned do not count)
+DEFAULT_WEIGHTS = {"geocode": 0.5, "buildings": 2.0, "parcelles": 2.0, "alti": 4.0, "write": 1.5}
+
+
+class Metrics:
+    def __init__(self, label: str = "", logger: Optional[logging.Logger] = None,
+                 on_progress: Optional[Callable[[float], None]] = None,
+                 profile_dir: Optional[str] = None, weights: Optional[Dict[str, float]] = None):
+        self.label = label
+        self.logger = logger
+        self.on_progress = on_progress
+        self.profile_dir = profile_dir
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.spans = []
+        self.counters = defaultdict(float)
+        self._planned = {}
+        self._done = defaultdict(float)
+        self._lock = threading.Lock()
+        self._notify_lock = threading.Lock()
+        self._reported = 0.0
+        self._t0 = time.perf_counter()
+        self._profiling = False
+
+    # -------- timing --------
+    @contextmanager
+    def span(self, name: str, profile: bool = False, **attrs):
+        """
+        Time the block. The caller may fill rec["items"] / rec["bytes"] inside it.
+        With profile=True and a profile_dir, the block also runs under cProfile.
+        """
+        rec = {"name": name, "items": 0, "bytes": 0, **attrs}
+        prof = self._start_profile() if profile else None
+        t = time.perf_counter()
+        try:
+            yield rec
+        except BaseException as e:
+            rec["error"] = type(e).__name__
+            raise
+        finally:
+            rec["start"] = round(t - self._t0, 4)
+            rec["seconds"] = time.perf_counter() - t
+            if prof is not None:
+                self._stop_profile(prof, name)
+            with self._lock:
+                self.spans.append(rec)
+            if self.logger is not None:
+                self.logger.debug("%s %s %.3fs items=%s bytes=%s", self.label, name, rec["seconds"],
+                                  rec["items"], rec["bytes"])
+
+    def _start_profile(self):
+        # one profiler at a time: Python 3.12+ refuses a second active one anyway
+        if not self.profile_dir:
+            return None
+        with self._lock:
+            if self._profiling:
+                return None
+            self._profiling = True
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            with self._lock:
+                self._profiling = False
+            return None
+        return prof
+
+    def _stop_profile(self, prof, name):
+        prof.disable()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stem = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{self.label}_{name}").strip("_")
+        prof.dump_stats(os.path.join(self.profile_dir, f"{stem}.prof"))
+        with self._lock:
+            self._profiling = False
+
+    def count(self, name: str, n: float = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    # -------- progress --------
+    def plan(self, task: str, total: float, add: bool = False):
+        """Declare (or with add=True extend) the number of work units of `task`."""
+        with self._lock:
+            self._planned[task] = self._planned.get(task, 0) + total if add else total
+        self._notify()
+
+    def advance(self, task: str, n: float = 1):
+        with self._lock:
+            self._done[task] += n
+        self._notify()
+
+    def progress(self) -> float:
+        """Weighted fraction of the planned work that is done, 0..1."""
+        with self._lock:
+            tasks = [t for t in self._planned if self.weights.get(t, 1.0) > 0]
+            total_w = sum(self.weights.get(t, 1.0) for t in tasks)
+            if not total_w:
+                return 0.0
+            done = sum(self.weights.get(t, 1.0) * min(1.0, self._done[t] / self._planned[t])
+                       for t in tasks if self._planned[t] > 0)
+            done += sum(self.weights.get(t, 1.0) for t in tasks if self._planned[t] <= 0)
+        return done / total_w
+
+    def _notify(self):
+        # plans extended after some progress (add=True) lower progress(): what on_progress
+        # sees never goes back, and calls from several threads arrive in order
+        if self.on_progress is None:
+            return
+        with self._notify_lock:
+            self._reported = max(self._reported, self.progress())
+            self.on_progress(self._reported)
+
+    # -------- results --------
+    def summary(self) -> dict:
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        for rec in spans:
+            s = stages.setdefault(rec["name"], {"count": 0, "seconds": 0.0, "items": 0, "bytes": 0, "errors": 0})
+            s["count"] += 1
+            s["seconds"] += rec["seconds"]
+            s["items"] += rec["items"] or 0
+            s["bytes"] += rec["bytes"] or 0
+            s["errors"] += "error" in rec
+        for s in stages.values():
+            s["seconds"] = round(s["seconds"], 4)
+            s["items_per_s"] = round(s["items"] / s["seconds"], 1) if s["items"] and s["seconds"] > 0 else None
+            s["mb_per_s"] = round(s["bytes"] / 2 ** 20 / s["seconds"], 3) if s["bytes"] and s["seconds"] > 0 else None
+        # spans carry the bytes of this process; a batch adds up its jobs' totals as a counter
+        return {"label": self.label, "wall_seconds": round(time.perf_counter() - self._t0, 3),
+                "bytes_downloaded": sum(r["bytes"] or 0 for r in spans) + counters.get("bytes_downloaded", 0),
+                "stages": stages, "counters": counters}
+
+    def write_json(self, path: str, include_spans: bool = True):
+        out = self.summary()
+        if include_spans:
+            with self._lock:
+                out["spans"] = [{**r, "seconds": round(r["seconds"], 4)} for r in self.spans]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(out, f, indent=2, ensure_ascii=False, default=str)
+        return path
+
+    def log_summary(self, logger: Optional[logging.Logger] = None):
+        logger = logger or self.logger
+        if logger is None:
+            return
+        s = self.summary()
+        logger.info("%s : %.2f s, %.2f Mo téléchargés", self.label, s["wall_seconds"], s["bytes_downloaded"] / 2 ** 20)
+        for name, st in sorted(s["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+            logger.info("  %-36s x%-4d %8.3f s %9d éléments %10s /s", name, st["count"], st["seconds"],
+                        st["items"], st["items_per_s"])
+        for name, n in sorted(s["counters"].items()):
+            logger.info("  %-36s %g", name, n)
+
+
+class NullMetrics(Metrics):
+    """Default when the caller does not instrument: spans are timed for nobody."""
+    @contextmanager
+    def span(self, name: str, profile: bool = False, **attrs):
+        yield {"name": name, "items": 0, "bytes": 0}
+
+    def count(self, name, n=1):
+        pass
+
+    def plan(self, task, total, add=False):
+        pass
+
+    def advance(self, task, n=1):
+        pass
+
+
+NO_METRICS = NullMetrics()
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.pipeline
+Headless fetch -> reproject -> write pipeline, shared by the Tkinter UI
+and the batch CLI (cadastre_app.batch).
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from shapely.geometry import box, Point
+
+from .config import DEFAULT_CRS_2154, DEFAULT_STEP, ALTI_TOLERANCE
+from .geocode import Address
+from .wfs import fetch_buildings, fetch_parcelles, fetch_alti
+from .tilecache import default_cache
+from .altistore import default_store
+from .crsmap import epsg_from_postcode, epsg_from_latitude, meters_bbox_around_lonlat, reproject, get_transformer
+from .contours import contour_gdf
+from .geometry import repair_layer, clip_to_extent
+from .metrics import Metrics, NO_METRICS
+from .cancel import CancelToken, check, child_token
+from .dxfwriter import (new_document, add_buildings, add_parcelles, add_points_alti, add_tin_alti, add_contours,
+                        save_document, discard_document)
+
+
+@dataclass
+class ExportJob:
+    address: Address
+    out_path: str
+    radius: int = 20
+    step: int = DEFAULT_STEP
+    alti: bool = True
+    layer_building: str = "Batiment"
+    layer_parcelle: str = "Parcelle"
+    layer_point_alti: str = "Point_Altimetrique"
+    layer_tin: str = "TIN_Altimetrique"
+    layer_contour: str = "Courbes_de_niveau"
+    cache: bool = True
+    adaptive: bool = False
+    tolerance: float = ALTI_TOLERANCE
+    streaming: bool = False
+    compact: bool = False   # LWPOLYLINE + elevation instead of POLYLINE/VERTEX
+    binary: bool = False    # binary DXF (not with streaming)
+    tin: str = ""           # "mesh" or "3dface": triangulated surface instead of the points
+    contour_interval: float = 0.0  # > 0: contour lines every N metres instead of the points
+    extent: str = "square"  # "square" (side 2 x radius) or "circle" (radius) around the address
+    clip: str = "clip"      # "clip": cut features at the extent, "filter": keep them whole, "": WFS bbox as is
+    server_crs: bool = True  # request the layers in the target CC CRS (False: EPSG:2154, reprojected locally)
+    metrics_path: str = ""  # JSON file receiving the per-stage metrics of the job
+    profile_dir: str = ""   # cProfile dump of each top-level stage goes there
+
+
+def target_epsg_for(addr: Address) -> str:
+    if addr.postcode:
+        return epsg_from_postcode(addr.postcode)
+    return epsg_from_latitude(addr.lat)
+
+
+def dxf_format(job: ExportJob) -> str:
+    """Short label of the output mode, for summaries: r12-stream / r2018, +compact, +bin."""
+    fmt = "r12-stream" if job.streaming else "r2018"
+    if job.compact:
+        fmt += "+compact"
+    if job.binary:
+        fmt += "+bin"
+    if job.tin:
+        fmt += f"+tin-{job.tin}"
+    if job.extent == "circle":
+        fmt += "+circle"
+    if job.contour_interval:
+        fmt += f"+contours-{job.contour_interval:g}"
+    return fmt
+
+
+def export_extent(addr: Address, radius, crs, shape="square"):
+    """Requested area in `crs`: the square bbox, or the circle of `radius` around the address."""
+    if shape == "circle":
+        x, y = get_transformer("EPSG:4326", crs).transform(addr.lon, addr.lat)
+        return Point(x, y).buffer(float(radius), quad_segs=32)
+    return box(*meters_bbox_around_lonlat(addr.lon, addr.lat, radius, crs))
+
+
+def fetch_layers(job: ExportJob, bbox, crs=DEFAULT_CRS_2154, workers: int = 3, metrics: Metrics = NO_METRICS,
+                 cancel: Optional[CancelToken] = None):
+    """
+    Start the building, parcel and elevation fetches at the same time and yield
+    (name, layer) pairs in completion order, so a layer can be processed while the
+    others are still downloading. Buildings and parcels come as features.FeatureTable,
+    elevations as a GeoDataFrame. `bbox` and the results are in `crs`.
+    If a fetch fails or the consumer stops early (close the generator), the other
+    fetches are cancelled and not waited for.
+    """
+    cache = default_cache() if job.cache else None
+    with child_token(cancel) as stop:
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futs = {
+                pool.submit(fetch_buildings, bbox, crs=crs, max_per_page=5000,
+                            parallel=True, cache=cache, metrics=metrics, task="buildings", cancel=stop,
+                            table=True): "buildings",
+                pool.submit(fetch_parcelles, bbox, crs=crs, max_per_page=5000,
+                            parallel=True, cache=cache, metrics=metrics, task="parcelles", cancel=stop,
+                            table=True): "parcelles",
+            }
+            if job.alti:
+                store = default_store() if job.cache else None
+                futs[pool.submit(fetch_alti, job.address, job.radius, job.step, store=store, crs=crs,
+                                  adaptive=job.adaptive, tolerance=job.tolerance, metrics=metrics,
+                                  cancel=stop)] = "alti"
+            for fut in as_completed(futs):
+                yield futs[fut], fut.result()
+        finally:
+            # running fetches stop at their next check; their Cancelled is never read
+            stop.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_export(job: ExportJob, progress: Optional[Callable[[str], None]] = None,
+               metrics: Optional[Metrics] = None, cancel: Optional[CancelToken] = None) -> dict:
+    """
+    Run one export job and return its summary row. Errors are raised.
+    Every stage is timed on `metrics` (a fresh one by default); the summary goes
+    to the "cadastre" log and, with job.metrics_path, to a JSON file.
+    Cancelling `cancel` stops the job with cancel.Cancelled and no output file;
+    tiles and elevation chunks downloaded so far stay in the caches (job.cache).
+    """
+    def report(msg):
+        if progress is not None:
+            progress(msg)
+
+    if metrics is None:
+        metrics = Metrics(label=os.path.splitext(os.path.basename(job.out_path))[0],
+                          logger=logging.getLogger("cadastre"), profile_dir=job.profile_dir or None)
+    try:
+        return _run_export(job, report, metrics, cancel)
+    finally:
+        metrics.log_summary()
+        if job.metrics_path:
+            metrics.write_json(job.metrics_path)
+
+
+def _run_export(job: ExportJob, report, metrics: Metrics, cancel: Optional[CancelToken]) -> dict:
+    t0 = time.perf_counter()
+    addr = job.address
+    if job.binary and job.streaming:
+        raise ValueError("Le DXF binaire n'est pas disponible en mode streaming.")
+
+    # 1) target EPSG from postcode; the WFS reprojects server-side (srsName) unless disabled
+    target_epsg = target_epsg_for(addr)
+    fetch_crs = target_epsg if job.server_crs else DEFAULT_CRS_2154
+    bbox = meters_bbox_around_lonlat(addr.lon, addr.lat, job.radius, fetch_crs)
+    extent = export_extent(addr, job.radius, target_epsg, job.extent)
+
+    # streaming: entities go to the file as each layer arrives, overlapping the other fetches
+    write_points = job.alti and not job.tin and not job.contour_interval
+    doc = new_document(job.layer_building, job.layer_parcelle, job.layer_point_alti, write_points,
+                       streaming_path=job.out_path if job.streaming else None,
+                       layer_tin=job.layer_tin if job.alti and job.tin else None,
+                       layer_contour=job.layer_contour if job.alti and job.contour_interval else None)
+    msp = doc.modelspace()
+    counts = {"buildings": 0, "parcelles": 0, "alti": 0, "faces": 0, "contours": 0, "repaired": 0, "dropped": 0}
+    empty = True
+    write_s = 0.0  # entity generation + save, to compare output modes
+    metrics.plan("write", 3 + job.alti)  # one unit per layer, one for the save
+
+    try:
+        # 2) fetch the layers concurrently; reproject and generate entities as each one arrives
+        report("Récupération des bâtiments, parcelles et points altimétriques …")
+        with closing(fetch_layers(job, bbox, fetch_crs, metrics=metrics, cancel=cancel)) as layers:
+            for name, gdf in layers:
+                check(cancel)
+                if gdf.empty:
+                    metrics.advance("write")
+                    continue
+                empty = False
+                if name != "alti":
+                    # once per layer: the writer then trusts the geometry
+                    with metrics.span(f"repair:{name}", profile=True) as rec:
+                        gdf, n_repaired, n_dropped = repair_layer(gdf)
+                        rec["items"] = len(gdf)
+                    counts["repaired"] += n_repaired
+                    counts["dropped"] += n_dropped
+                tw = time.perf_counter()
+                if name == "alti" and job.contour_interval:
+                    # contouring needs the regular grid, i.e. the points before reprojection
+                    report("Calcul des courbes de niveau …")
+                    with metrics.span("contours", profile=True) as rec:
+                        contours = reproject(contour_gdf(gdf, job.step, job.contour_interval), target_epsg)
+                        contours = clip_to_extent(contours, extent, job.clip)
+                        rec["items"] = counts["contours"] = add_contours(msp, contours, job.layer_contour,
+                                                                         compact=job.compact, cancel=cancel)
+                with metrics.span(f"reprojection:{name}", profile=True) as rec:
+                    gdf = reproject(gdf, target_epsg)  # no-op when fetched in the target CRS
+                    rec["items"] = len(gdf)
+                with metrics.span(f"clip:{name}", profile=True) as rec:
+                    gdf = clip_to_extent(gdf, extent, job.clip)
+                    rec["items"] = len(gdf)
+                with metrics.span(f"write:{name}", profile=True) as rec:
+                    if name == "buildings":
+                        report("Bâtiments reçus, génération des entités …")
+                        counts[name] = add_buildings(msp, gdf, job.layer_building, point_alti=job.alti,
+                                                     compact=job.compact, cancel=cancel)
+                    elif name == "parcelles":
+                        report("Parcelles reçues, génération des entités …")
+                        counts[name] = add_parcelles(msp, gdf, job.layer_parcelle, compact=job.compact,
+                                                     cancel=cancel)
+                    else:
+                        report("Points altimétriques reçus, génération des entités …")
+                        if job.tin:
+                            counts[name], counts["faces"] = add_tin_alti(msp, gdf, job.layer_tin, extent, job.tin)
+                        elif write_points:
+                            counts[name] = add_points_alti(msp, gdf, job.layer_point_alti, cancel)
+                    rec["items"] = counts[name]
+                write_s += time.perf_counter() - tw
+                metrics.advance("write")
+                del gdf
+
+        if empty:
+            raise RuntimeError("Aucune entité trouvée dans l’emprise demandée.")
+
+        # 3) write DXF
+        check(cancel)
+        report("Écriture du DXF …")
+        tw = time.perf_counter()
+        with metrics.span("write:save", profile=True) as rec:
+            save_document(doc, job.out_path, addr.label, target_epsg, binary=job.binary)
+            rec["size_bytes"] = os.path.getsize(job.out_path)
+        write_s += time.perf_counter() - tw
+        metrics.advance("write")
+    except BaseException:
+        discard_document(doc)
+        raise
+    return {
+        "label": addr.label,
+        "lon": addr.lon,
+        "lat": addr.lat,
+        "radius": job.radius,
+        "step": job.step,
+        "out_path": job.out_path,
+        "target_epsg": target_epsg,
+        "n_buildings": counts["buildings"],
+        "n_parcelles": counts["parcelles"],
+        "n_points_alti": counts["alti"],
+        "n_faces": counts["faces"],
+        "n_contours": counts["contours"],
+        "n_repaired": counts["repaired"],
+        "n_dropped": counts["dropped"],
+        "dxf_format": dxf_format(job),
+        "size_bytes": os.path.getsize(job.out_path),
+        "write_seconds": round(write_s, 3),
+        "bytes_downloaded": metrics.summary()["bytes_downloaded"],
+        "seconds": round(time.perf_counter() - t0, 3),
+        "status": "ok",
+        "error": "",
+    }
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Adaptive samples are filled back onto the full lattice before contouring."""
+
+import numpy as np
+
+from ..contours import fill_unsampled, grid_from_points, contour_lines
+
+
+def _lattice(n):
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    return i, j, 100.0 + 0.5 * i + 0.25 * j + 0.01 * i * j  # bilinear
+
+
+def test_fill_unsampled_is_bilinear():
+    i, j, Z = _lattice(17)
+    sparse = np.full_like(Z, np.nan)
+    sparse[::8, ::8] = Z[::8, ::8]      # coarse cells
+    sparse[:9:2, :9:2] = Z[:9:2, :9:2]  # one corner refined twice
+    fill_unsampled(sparse)
+    assert np.allclose(sparse, Z)
+
+
+def test_nodata_is_not_interpolated():
+    i, j, Z = _lattice(9)
+    sparse = np.full_like(Z, np.nan)
+    sparse[::4, ::4] = Z[::4, ::4]
+    sparse[0, 0] = np.inf
+    fill_unsampled(sparse)
+    assert np.isinf(sparse[:4, :4]).any() and np.isfinite(sparse[4:, 4:]).all()
+
+
+def test_adaptive_contours_are_not_fragmented():
+    i, j, Z = _lattice(33)
+    keep = (i % 8 == 0) & (j % 8 == 0)
+    x, y, z = i[keep] * 5.0, j[keep] * 5.0, Z[keep]
+    x0, y0, grid = grid_from_points(x, y, z, 5.0)
+    assert np.allclose(grid, Z)
+    full = contour_lines((i * 5.0).ravel(), (j * 5.0).ravel(), Z.ravel(), 5.0, 2.0)
+    assert len(contour_lines(x, y, z, 5.0, 2.0)) == len(full)
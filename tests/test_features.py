@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Empty geometries in a FeatureTable: stored as missing rows, never as zero-ring parts."""
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon, box
+
+from ..features import FeatureTable, POLYGON
+
+
+def _feature(geometry, i):
+    return {"type": "Feature", "id": f"f.{i}", "properties": {"n": i}, "geometry": geometry}
+
+
+def _table(*geometries):
+    square = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+    return FeatureTable.from_features([_feature(square, 0)] + [_feature(g, i + 1) for i, g in enumerate(geometries)])
+
+
+def _check(t, n):
+    assert len(t) == n + 1
+    assert t.kinds[0] == POLYGON and (t.kinds[1:] == -1).all()
+    geoms = t.geometries()
+    assert geoms[0].equals(box(0, 0, 1, 1))
+    assert all(g is None for g in geoms[1:])
+
+
+def test_empty_polygon():
+    _check(_table({"type": "Polygon", "coordinates": []}, {"type": "Polygon", "coordinates": [[]]}), 2)
+
+
+def test_empty_multipolygon():
+    _check(_table({"type": "MultiPolygon", "coordinates": []}, {"type": "MultiPolygon", "coordinates": [[]]},
+                  {"type": "MultiPolygon", "coordinates": [[[]]]}), 3)
+
+
+def test_empty_point():
+    _check(_table({"type": "Point", "coordinates": []}, {"type": "MultiPoint", "coordinates": [[]]}), 2)
+
+
+def test_empty_part_is_left_out():
+    t = _table({"type": "MultiPolygon", "coordinates": [[], [[[2, 2], [3, 2], [3, 3], [2, 2]]]]})
+    assert t.kinds[1] == POLYGON
+    assert t.geometries()[1].equals(Polygon([(2, 2), (3, 2), (3, 3)]))
+
+
+def test_from_geometries_empty():
+    geoms = np.array([box(0, 0, 1, 1), Polygon(), shapely.from_wkt("POINT EMPTY"), None], dtype=object)
+    _check(FeatureTable.from_geometries(geoms), 3)
+
+
+def test_in_bbox_from_coordinates():
+    t = _table({"type": "LineString", "coordinates": [[5, 5], [6, 7]]}, {"type": "Polygon", "coordinates": []})
+    assert np.allclose(t.bounds()[:2], [[0, 0, 1, 1], [5, 5, 6, 7]])
+    assert t.in_bbox((0.5, 0.5, 2, 2)).tolist() == [True, False, False]
+    assert t.in_bbox((5.5, 6, 9, 9)).tolist() == [False, True, False]
+    assert t._geometries is None
+
+
+def test_geometries_built_once():
+    t = _table({"type": "Point", "coordinates": [3, 4]})
+    geoms = t.geometries()
+    assert t.geometries() is geoms
+    assert t.take([1])._geometries[0] is geoms[1]
+    assert t.select({"n": ["n"]}).geometries() is geoms
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""Progress reported by Metrics never goes back when a plan grows."""
+
+from ..metrics import Metrics
+
+
+def test_progress_reported_never_decreases():
+    seen = []
+    m = Metrics(on_progress=seen.append, weights={"buildings": 1.0})
+    m.plan("buildings", 1, add=True)
+    m.advance("buildings")
+    m.plan("buildings", 1, add=True)  # the page came back full: one more to fetch
+    assert m.progress() == 0.5
+    m.advance("buildings")
+    assert seen == [0.0, 1.0, 1.0, 1.0]
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""The UI module imports without the geo stack (benchmarks.startup, in a fresh interpreter)."""
+
+import sys
+
+import pytest
+
+from ..benchmarks.startup import PACKAGE, measure
+
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="ui.py uses PEP 701 f-strings")
+def test_ui_import_leaves_geo_stack_unloaded():
+    res = measure(f"{PACKAGE}.ui", repeat=1)
+    assert not {"geopandas", "shapely", "pyproj", "ezdxf"} & set(res["loaded"]), res
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.tilecache
+On-disk cache of WFS features on a fixed metric tile grid (Lambert-93 or CC
+zone coordinates). Each tile is one gzipped JSON file keyed by layer, CRS and
+tile index. Entries expire after a TTL; the whole cache is kept under a size
+cap by evicting the least recently used tiles.
+"""
+
+import gzip
+import math
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .features import loads, dumps
+from .config import CACHE_DIR, TILE_SIZE_M, CACHE_TTL_S, CACHE_MAX_BYTES, DEFAULT_CRS_2154, CC_TO_EPSG
+
+Tile = Tuple[int, int]
+
+METRIC_CRS = {DEFAULT_CRS_2154, *CC_TO_EPSG.values()}
+
+
+class TileCache:
+    def __init__(self, root=None, tile_size=TILE_SIZE_M, ttl=CACHE_TTL_S, max_bytes=CACHE_MAX_BYTES):
+        self.root = os.path.join(root or CACHE_DIR, "wfs")
+        self.tile_size = float(tile_size)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    # -------- grid --------
+    def supports(self, crs) -> bool:
+        return str(crs).upper() in METRIC_CRS
+
+    def tiles_for_bbox(self, bbox) -> List[Tile]:
+        minx, miny, maxx, maxy = bbox
+        s = self.tile_size
+        return [
+            (ix, iy)
+            for ix in range(math.floor(minx / s), math.floor(maxx / s) + 1)
+            for iy in range(math.floor(miny / s), math.floor(maxy / s) + 1)
+        ]
+
+    def tile_bbox(self, tile: Tile):
+        ix, iy = tile
+        s = self.tile_size
+        return (ix * s, iy * s, (ix + 1) * s, (iy + 1) * s)
+
+    def union_bbox(self, tiles: Iterable[Tile]):
+        ixs, iys = zip(*tiles)
+        s = self.tile_size
+        return (min(ixs) * s, min(iys) * s, (max(ixs) + 1) * s, (max(iys) + 1) * s)
+
+    def split(self, features: list, bounds, tiles: Iterable[Tile]) -> Dict[Tile, list]:
+        """
+        Spread `features` over `tiles` by envelope: a feature goes into every tile its
+        bounds (one (minx, miny, maxx, maxy) row per feature) meet; NaN bounds go nowhere.
+        """
+        out = {t: [] for t in tiles}
+        for f, b in zip(features, bounds):
+            if any(math.isnan(v) for v in b):
+                continue
+            for t in self.tiles_for_bbox(b):
+                if t in out:
+                    out[t].append(f)
+        return out
+
+    # -------- storage --------
+    def _path(self, layer_name, crs, tile: Tile):
+        layer = re.sub(r"[^A-Za-z0-9_.-]", "_", layer_name)
+        crs_dir = re.sub(r"[^A-Za-z0-9_.-]", "_", str(crs))
+        return os.path.join(self.root, layer, crs_dir, f"{int(self.tile_size)}_{tile[0]}_{tile[1]}.json.gz")
+
+    def get(self, layer_name, crs, tile: Tile) -> Optional[list]:
+        path = self._path(layer_name, crs, tile)
+        try:
+            with gzip.open(path, "rb") as f:
+                data = loads(f.read())
+        except (OSError, ValueError):
+            return None
+        if self.ttl is not None and time.time() - data.get("created", 0) > self.ttl:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # mtime = last access, for LRU eviction
+        except OSError:
+            pass
+        return data.get("features", [])
+
+    def put(self, layer_name, crs, tile: Tile, features: list):
+        path = self._path(layer_name, crs, tile)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wb") as f:
+            f.write(dumps({"created": time.time(), "features": features}))
+        os.replace(tmp, path)
+
+    def lookup(self, layer_name, crs, tiles: Iterable[Tile], convert=None) -> Tuple[Dict[Tile, list], List[Tile]]:
+        """
+        Split `tiles` into ({tile: features} found in cache, [missing tiles]).
+        `convert` is applied to each tile's features as it is read (e.g. into a FeatureTable).
+        """
+        found, missing = {}, []
+        for t in tiles:
+            feats = self.get(layer_name, crs, t)
+            if feats is None:
+                missing.append(t)
+            else:
+                found[t] = convert(feats) if convert is not None else feats
+        return found, missing
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop expired tiles, then least recently used ones until under `max_bytes`."""
+        with self._lock:
+            entries = []
+            now = time.time()
+            for dirpath, _, files in os.walk(self.root):
+                for name in files:
+                    if not name.endswith(".json.gz"):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    # a tile not read for ttl seconds is expired for sure
+                    if self.ttl is not None and now - st.st_mtime > self.ttl:
+                        self._remove(path)
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+            if self.max_bytes is None:
+                return
+            total = sum(e[1] for e in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+
+def merge_tiles(tile_features: Iterable[list]) -> list:
+    """Concatenate per-tile features, keeping the first occurrence of each feature id."""
+    seen = set()
+    out = []
+    for feats in tile_features:
+        for f in feats:
+            fid = f.get("id")
+            if fid is not None:
+                if fid in seen:
+                    continue
+                seen.add(fid)
+            out.append(f)
+    return out
+
+
+_default_cache = None
+
+def default_cache() -> TileCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TileCache()
+    return _default_cache
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+cadastre_app.transport
+The one HTTP session shared by the WFS, altimetry and geocoding clients:
+a pooled HTTPAdapter with the RETRIES policy, keep-alive connections (one
+TLS handshake per pooled connection instead of one per request), gzip
+responses, and a cap on simultaneous requests per host.
+"""
+
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import (USER_AGENT, RETRIES, POOL_MAXSIZE, HOST_CONCURRENCY, DEFAULT_HOST_CONCURRENCY,
+                     ALTI_URL)
+from .cancel import CancelToken, Cancelled, check
+
+READ_CHUNK = 64 * 1024  # cancellation is checked between chunks of a response body
+
+_host_slots = {}
+_host_lock = threading.Lock()
+
+
+def _make_session() -> requests.Session:
+    s = requests.Session()
+    s.headers.update({
+        "User-Agent": USER_AGENT,
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
+    adapter = HTTPAdapter(max_retries=RETRIES, pool_connections=8, pool_maxsize=POOL_MAXSIZE)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+session = _make_session()
+
+
+def mount_rate_limited(prefix):
+    """URLs under `prefix` get 429/503 back instead of retries, for a caller-side RateLimiter."""
+    session.mount(prefix, HTTPAdapter(max_retries=RETRIES.new(status_forcelist=(500, 502, 504)),
+                                      pool_connections=1, pool_maxsize=POOL_MAXSIZE))
+
+
+# altimetry: 429/503 go to the adaptive RateLimiter of wfs.fetch_alti
+mount_rate_limited(ALTI_URL)
+
+
+def mount_single_post(prefix):
+    """
+    POSTs under `prefix` are sent once: only connection failures (nothing sent yet) are
+    retried. For large uploads, which the caller splits or retries itself.
+    """
+    session.mount(prefix, HTTPAdapter(max_retries=RETRIES.new(allowed_methods=frozenset({"GET", "HEAD"})),
+                                      pool_connections=1, pool_maxsize=POOL_MAXSIZE))
+
+
+def host_slot(url) -> threading.BoundedSemaphore:
+    host = urlsplit(url).hostname or ""
+    with _host_lock:
+        sem = _host_slots.get(host)
+        if sem is None:
+            sem = _host_slots[host] = threading.BoundedSemaphore(
+                HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+        return sem
+
+
+@contextmanager
+def limited(url):
+    """Hold one of the host's concurrency slots for the duration of the block."""
+    sem = host_slot(url)
+    with sem:
+        yield
+
+
+def request(method, url, cancel: Optional[CancelToken] = None, **kwargs) -> requests.Response:
+    """
+    session.request under the per-host limit; the body is read before the slot is released.
+    With `cancel`, the body is read in chunks and the response is closed as soon as
+    the token is cancelled, which raises cancel.Cancelled here.
+    """
+    check(cancel)
+    with limited(url):
+        check(cancel)
+        if cancel is None:
+            r = session.request(method, url, **kwargs)
+            r.content  # noqa: B018 -- download now, while the slot is held
+            return r
+        r = session.request(method, url, stream=True, **kwargs)
+        r._content = b"".join(iter_body(r, cancel))  # what Response.content would have read
+        r._content_consumed = True
+        check(cancel)
+        return r
+
+
+def iter_body(r: requests.Response, cancel: Optional[CancelToken] = None, chunk_size: int = READ_CHUNK):
+    """The body of a stream=True response in chunks; cancel() closes the response and raises Cancelled here."""
+    with cancel.on_cancel(r.close) if cancel is not None else nullcontext():
+        try:
+            for chunk in r.iter_content(chunk_size):
+                check(cancel)
+                yield chunk
+        except Cancelled:
+            r.close()
+            raise
+        except Exception as e:
+            # reading from a response closed by cancel() fails in various ways
+            if cancel is not None and cancel.cancelled:
+                raise Cancelled() from e
+            raise
+
+
+@contextmanager
+def stream(method, url, cancel: Optional[CancelToken] = None, **kwargs):
+    """
+    Like request, but the body is left unread: yields (response, chunk iterator) for
+    the caller to parse as it arrives. The host slot is held until the block exits.
+    """
+    check(cancel)
+    with limited(url):
+        check(cancel)
+        r = session.request(method, url, stream=True, **kwargs)
+        try:
+            yield r, iter_body(r, cancel)
+        finally:
+            r.close()
+
+
+def get(url, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def wire_bytes(r: requests.Response) -> int:
+    """Bytes received for the body of `r` as sent over the wire (compressed size when gzipped)."""
+    try:
+        n = r.raw.tell()
+        if n:
+            return int(n)
+    except (AttributeError, OSError):
+        pass
+    try:
+        return len(r.content or b"")
+    except RuntimeError:  # streamed body, already consumed
+        return 0
@@ -2,7 +2,7 @@
 """
 cadastre_app.ui
 Tkinter UI for the cadastre app:
-- geocodes an address (Addok),
+- geocodes an address (Addok) off the Tk thread, with type-ahead suggestions,
 - fetches WFS buildings/parcelles in a bbox around the address,
 - reprojects to CC zone EPSG based on postcode,
 - writes a DXF with two layers (Batiment / Parcelle),
@@ -11,28 +11,27 @@ Tkinter UI for the cadastre app:
 Requires sibling modules:
   cadastre_app.config
   cadastre_app.geocode
-  cadastre_app.wfs
   cadastre_app.crsmap
-  cadastre_app.dxfwriter
+  cadastre_app.pipeline (wfs / dxfwriter)
 """
 
 import os
 from pathlib import Path
+import importlib
 import re
 import threading
+import time
 import queue
-from tkinter import Tk, Toplevel, Label, Button, Entry, StringVar, IntVar, filedialog, Frame, BooleanVar, Checkbutton
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import Tk, Toplevel, Label, Button, Entry, StringVar, IntVar, filedialog, Frame, BooleanVar, Checkbutton, Listbox
 from tkinter import ttk
 
-import geopandas as gpd
-from pyproj import Transformer
-from shapely.geometry import box
-
-from .config import TEXT_FONT, BUTTON_FONT, ENTRY_FONT, DEFAULT_CRS_2154, DEFAULT_STEP, EMPTY_ALTI
-from .geocode import geocode, Address
-from .wfs import fetch_buildings, fetch_parcelles, fetch_alti
-from .crsmap import epsg_from_postcode
-from .dxfwriter import write_dxf_two_layers
+from .config import (TEXT_FONT, BUTTON_FONT, ENTRY_FONT, DEFAULT_CRS_2154, DEFAULT_STEP,
+                     SUGGEST_DELAY_MS, SUGGEST_MIN_CHARS, SUGGEST_LIMIT, LOG_PATH, METRICS_DIR)
+from .geocode import geocode, suggest, default_geocode_cache, Address
+from .metrics import Metrics
+from .cancel import CancelToken, Cancelled
+from .logutil import setup_logger
 
 
 class App:
@@ -47,12 +46,32 @@ class App:
         self._contour = True
         self._contour_var = BooleanVar(value=self._contour)
         self._contour_var.trace_add("write", lambda *a: setattr(self, "_contour", self._contour_var.get()))
+        self._adaptive_var = BooleanVar(value=False)
         self.calculated_pts = StringVar(value= f"  ( {((self.distance_var.get()*2)//self.distance_pas.get()+2)**2} points à créer)")
         self.msg_queue = queue.Queue()
         self._candidates = []
         self._selected_addr = None
+        # geocoding runs on one background thread; each new lookup supersedes the previous one
+        self._geocoder = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+        self._query_gen = 0
+        self._suggest_after = None
+        self._sugg = None
+        self._sugg_addrs = []
+        self.logger = setup_logger(log_path=LOG_PATH)
+        self._metrics = None  # of the next export, opened by the geocoding that precedes it
         
         self._layout()
+        # the geo stack (geopandas, pyproj, shapely, ezdxf) loads while the user types
+        self.root.after_idle(self._warm_up)
+
+    def _warm_up(self):
+        def load():
+            try:
+                importlib.import_module(".pipeline", __package__)
+            except Exception:
+                self.logger.exception("Préchargement des modules")
+        threading.Thread(target=load, name="warm-up", daemon=True).start()
 
         
     # -------- window / DPI --------
@@ -85,7 +104,8 @@ class App:
             d = self.distance_var.get()
             pas = self.distance_pas.get()
             n = ((2*d // pas) + 2) ** 2
-            self.calculated_pts.set(f"  ( {n if self._contour else "-"} points à créer)")
+            prefix = "≤ " if self._adaptive_var.get() else ""
+            self.calculated_pts.set(f"  ( {prefix}{n if self._contour else "-"} points à créer)")
         except Exception:
             self.calculated_pts.set("  ( -- points à créer)")
         
@@ -101,11 +121,7 @@ class App:
 
         self.entree = Entry(r, name="entree", textvariable=self.manual_val, font=ENTRY_FONT)
         self.entree.grid(row=1, column=0, sticky="new", padx=8)
-        
-        def _invalidate_if_changed(_evt=None):
-            if self._selected_addr and self.manual_val.get().strip() != self._selected_addr.label:
-                self._selected_addr = None
-        self.entree.bind("<KeyRelease>", _invalidate_if_changed)
+        self._bind_suggestions(self.entree)
 
 
         text_distance = Label(
@@ -166,6 +182,9 @@ class App:
         
         pas_text_03 = Label(pas_frame, textvariable=self.calculated_pts, name="pas_text_03", font=ENTRY_FONT)
         pas_text_03.pack(side="left")
+        
+        chk_adaptive = Checkbutton(pas_frame, text="adaptatif", variable=self._adaptive_var, command=self.update_pt_nb, font=ENTRY_FONT)
+        chk_adaptive.pack(side="left", padx=(8, 0))
 
         self.distance_var.trace_add("write", self.update_pt_nb)
         self.distance_pas.trace_add("write", self.update_pt_nb)
@@ -174,13 +193,95 @@ class App:
         bouton_v.grid(row=6, column=0, pady=(35,12), sticky="ne", padx=100)
         self.entree.bind("<Return>", lambda event: (bouton_v.invoke() if self.entree.get() else None))
 
+    # -------- geocoding off the Tk thread --------
+    def _lookup(self, fn, query, on_done):
+        """
+        Run fn(query) on the geocoding thread and hand (result, error) to on_done on the
+        Tk thread. A queued lookup that has not started yet is cancelled, and the answer
+        of one still in flight is dropped, as soon as a newer lookup is requested.
+        """
+        self._query_gen += 1
+        gen = self._query_gen
+        if self._pending is not None:
+            self._pending.cancel()
+
+        def task():
+            try:
+                res, err = fn(query), None
+            except Exception as e:
+                res, err = None, e
+            self.root.after(0, lambda: on_done(res, err) if gen == self._query_gen else None)
+
+        self._pending = self._geocoder.submit(task)
+
+    # -------- type-ahead suggestions --------
+    def _bind_suggestions(self, entry):
+        if self._sugg is None:
+            self._sugg = Listbox(self.root, font=ENTRY_FONT, height=SUGGEST_LIMIT, activestyle="none")
+            self._sugg.bind("<ButtonRelease-1>", self._pick_suggestion)
+            self._sugg.bind("<Return>", self._pick_suggestion)
+            self._sugg.bind("<Escape>", lambda e: (self._hide_suggestions(), self.entree.focus_set()))
+        entry.bind("<KeyRelease>", self._on_key)
+        entry.bind("<Down>", self._focus_suggestions)
+        entry.bind("<Escape>", lambda e: self._hide_suggestions())
+
+    def _on_key(self, evt):
+        if self._selected_addr and self.manual_val.get().strip() != self._selected_addr.label:
+            self._selected_addr = None
+        if evt.keysym in ("Return", "KP_Enter", "Down", "Up", "Escape", "Tab"):
+            return
+        # debounce: only ask once the typing pauses
+        if self._suggest_after is not None:
+            self.root.after_cancel(self._suggest_after)
+        self._suggest_after = self.root.after(SUGGEST_DELAY_MS, self._request_suggestions)
+
+    def _request_suggestions(self):
+        self._suggest_after = None
+        query = self.manual_val.get().strip()
+        if len(query) < SUGGEST_MIN_CHARS or (self._selected_addr and query == self._selected_addr.label):
+            self._hide_suggestions()
+            return
+        self._lookup(lambda q: suggest(q, cache=default_geocode_cache()), query, self._show_suggestions)
+
+    def _show_suggestions(self, found, err):
+        if err is not None or not found:
+            self._hide_suggestions()
+            return
+        self._sugg_addrs = found
+        self._sugg.delete(0, "end")
+        for a in found:
+            self._sugg.insert("end", a.label)
+        self._sugg.configure(height=min(SUGGEST_LIMIT, len(found)))
+        self._sugg.place(in_=self.entree, relx=0, rely=1, relwidth=1, y=2)
+        self._sugg.lift()
+
+    def _hide_suggestions(self):
+        if self._sugg is not None:
+            self._sugg.place_forget()
+
+    def _focus_suggestions(self, _evt=None):
+        if self._sugg is not None and self._sugg.winfo_ismapped():
+            self._sugg.focus_set()
+            self._sugg.selection_clear(0, "end")
+            self._sugg.selection_set(0)
+            self._sugg.activate(0)
+
+    def _pick_suggestion(self, _evt=None):
+        sel = self._sugg.curselection()
+        if not sel:
+            return
+        addr = self._sugg_addrs[sel[0]]
+        self._selected_addr = addr
+        self.manual_val.set(addr.label)
+        self._hide_suggestions()
+        self.entree.focus_set()
+        self.entree.icursor("end")
+
     # -------- helpers --------
     def meters_bbox_around_lonlat(self, lon, lat, meters, to_metric_crs=DEFAULT_CRS_2154):
         """Transform WGS84 lon/lat to metric CRS and expand a square bbox by `meters` in each direction."""
-        t = Transformer.from_crs("EPSG:4326", to_metric_crs, always_xy=True)
-        x, y = t.transform(lon, lat)
-        d = float(meters)
-        return (x - d, y - d, x + d, y + d)
+        from .crsmap import meters_bbox_around_lonlat
+        return meters_bbox_around_lonlat(lon, lat, meters, to_metric_crs)
 
     def select_filepath(self, addr):
         safe_name = re.sub(r'[\\/*?:"<>|]', "_", addr.label)
@@ -230,7 +331,7 @@ class App:
         w = Toplevel(self.root)
         w.overrideredirect(True)
         ww = max(360, self.screen_w // 6)
-        wh = 120
+        wh = 150
         x = (self.screen_w - ww) // 2
         y = (self.screen_h - wh) // 2
         w.geometry(f"{ww}x{wh}+{x}+{y}")
@@ -238,75 +339,62 @@ class App:
         customstyle.configure("cad.Progress.TFrame", background="black")
         frame = ttk.Frame(w, padding=4, style="cad.Progress.TFrame")
         frame.pack(fill="both", expand=True)
-        bar = ttk.Progressbar(frame, orient="horizontal", mode="indeterminate")
-        bar.place(rely=0.5, relheight=0.5, relwidth=1.0)
+        bar = ttk.Progressbar(frame, orient="horizontal", mode="determinate", maximum=100)
+        bar.place(rely=0.4, relheight=0.35, relwidth=1.0)
         label = Label(frame, text="Connexion WFS …", font=TEXT_FONT, bg="grey")
-        label.place(relheight=0.5, relwidth=1.0)
-        return w, bar, label
+        label.place(relheight=0.4, relwidth=1.0)
+        cancel_btn = Button(frame, text="Annuler", font=BUTTON_FONT)
+        cancel_btn.place(rely=0.75, relheight=0.25, relx=0.35, relwidth=0.3)
+        return w, bar, label, cancel_btn
 
     def _start_worker(self, addr) :
         out_path = self.select_filepath(addr)
         if not out_path:
             return
 
-        pw, bar, label = self._progress_window()
+        pw, bar, label, cancel_btn = self._progress_window()
+        cancel = CancelToken()
 
         def update_label(msg):
             self.msg_queue.put(msg)
 
+        def on_cancel():
+            cancel_btn.configure(state="disabled")
+            label.configure(text="Annulation …")
+            cancel.cancel()
+        cancel_btn.configure(command=on_cancel)
+
+        metrics = self._metrics or Metrics(logger=self.logger)
+        self._metrics = None
+        metrics.label = Path(out_path).stem
+        metrics.on_progress = update_label  # fractions, told apart from messages in poll()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+
         def worker():
             try:
-                # 1) bbox in EPSG:2154 (meters)
-                bbox_2154 = self.meters_bbox_around_lonlat(addr.lon, addr.lat, self.distance_var.get(), DEFAULT_CRS_2154)
-                minx, miny, maxx, maxy = bbox_2154
-                bbox_poly = box(minx, miny, maxx, maxy)
-
-                # 2) fetch layers
-                update_label("Récupération des bâtiments …")
-                gdf_b = fetch_buildings(bbox_2154, crs=DEFAULT_CRS_2154, max_per_page=5000)
-                update_label("Récupération des parcelles …")
-                gdf_p = fetch_parcelles(bbox_2154, crs=DEFAULT_CRS_2154, max_per_page=5000)
-
-                # 3) target EPSG from postcode
-                target_epsg = epsg_from_postcode(addr.postcode)
-                
-                #3b) points alti
-                if self._contour :
-                    update_label("Récupération des points altimetriques …")
-                    gdf_alti = fetch_alti(addr, self.distance_var.get(), self.distance_pas.get())
-                else :
-                    gdf_alti = EMPTY_ALTI.copy()
-                    
-                if gdf_b.empty and gdf_p.empty and gdf_alti.empty :
-                    raise RuntimeError("Aucune entité trouvée dans l’emprise demandée.")
-                
-                # 4) reproject
-                gdf_b2 = gdf_b.to_crs(target_epsg) if not gdf_b.empty else gdf_b
-                gdf_p2 = gdf_p.to_crs(target_epsg) if not gdf_p.empty else gdf_p
-                gdf_alti2 = gdf_alti.to_crs(target_epsg) if not gdf_alti.empty else gdf_alti
-
-                # 5) write DXF
-                #safe_name = re.sub(r'[\\/*?:"<>|]', "_", addr.label)
-                #out_path = os.path.join(out_dir, f"cadastre-{safe_name}.dxf")
-                nb, npoly, pt_alti = write_dxf_two_layers(
-                    gdf_b2,
-                    gdf_p2,
-                    gdf_alti2,
-                    out_path,
-                    layer_building="Batiment",
-                    layer_parcelle="Parcelle",
-                    layer_point_alti="Point_Altimetrique",
-                    address_for_note=addr.label,
-                    target_epsg_for_note=target_epsg,
-                    point_alti=self._contour
+                from .pipeline import ExportJob, run_export  # usually preloaded by _warm_up
+                job = ExportJob(
+                    address=addr,
+                    out_path=out_path,
+                    radius=self.distance_var.get(),
+                    step=self.distance_pas.get(),
+                    alti=self._contour,
+                    adaptive=self._adaptive_var.get(),
+                    metrics_path=os.path.join(METRICS_DIR, f"{metrics.label}_{stamp}.json"),
+                )
+                summary = run_export(job, progress=update_label, metrics=metrics, cancel=cancel)
+                update_label(
+                    f"Terminé : {summary['n_buildings']} bâtiments, {summary['n_parcelles']} parcelles, "
+                    f"{summary['n_points_alti']} points altimétriques (CRS {summary['target_epsg']})"
                 )
-                update_label(f"Terminé : {nb} bâtiments, {npoly} parcelles, {pt_alti} points altimétriques (CRS {target_epsg})")
                 # success prompt on main thread
                 self.root.after(0, lambda: self.prompt_after_save(out_path))    
+            except Cancelled:
+                update_label("Export annulé (les données reçues restent en cache)")
             except Exception as e:
+                self.logger.exception("Export %s", out_path)
                 update_label(f"ERREUR : {e}")
             finally:
-                bar.stop()
                 # destroy after a small delay (let the last message be visible)
                 self.root.after(1200, pw.destroy)
 
@@ -315,7 +403,10 @@ class App:
             try:
                 while True:
                     m = self.msg_queue.get_nowait()
-                    label.configure(text=m)
+                    if isinstance(m, float):
+                        bar.configure(value=round(100 * m))
+                    else:
+                        label.configure(text=m)
             except queue.Empty:
                 pass
             finally:
@@ -337,24 +428,45 @@ class App:
                     pass
 
         pw.bind("<Destroy>", reenable_all)
-        bar.start()
         threading.Thread(target=worker, daemon=True).start()
         poll()
 
     # -------- actions --------
     def _go(self):
+        # a suggestion request still due would bump _query_gen and drop this geocode
+        if self._suggest_after is not None:
+            self.root.after_cancel(self._suggest_after)
+            self._suggest_after = None
         address_input = self.manual_val.get().strip()
         if not address_input:
             return
         
+        self._hide_suggestions()
         if self._selected_addr and address_input == self._selected_addr.label:
+            self._query_gen += 1  # drop any suggestion still in flight
             self._start_worker(self._selected_addr)
             return
         
-        res = geocode(address_input, limit=20)
+        self._set_champ(" Recherche de l'adresse …  ")
+        metrics = self._metrics = Metrics(logger=self.logger)
+        metrics.plan("geocode", 1)
+
+        def lookup(q):
+            with metrics.span("geocode") as rec:
+                res = geocode(q, limit=20, cache=default_geocode_cache())
+                rec["items"] = len(res) if isinstance(res, list) else int(res is not None)
+            metrics.advance("geocode")
+            return res
+        self._lookup(lookup, address_input, self._on_geocoded)
+
+    def _on_geocoded(self, res, err):
+        if err is not None:
+            self._set_champ(f"Géocodage impossible ({type(err).__name__}), essayez à nouveau : ")
+            return
         if res is None:
             self._set_champ("Adresse introuvable, essayez à nouveau : ")
             return
+        self._set_champ(" Entrez l'adresse à rechercher :  ")
 
         if isinstance(res, list):
             # Multiple choices: show a combobox
@@ -395,6 +507,7 @@ class App:
         
         self.entree = Entry(wrapper, name="entree", textvariable=self.manual_val, font=ENTRY_FONT)
         self.entree.grid(row=5, column=0, sticky="new", padx=8)
+        self._bind_suggestions(self.entree)
         
         Button(
             wrapper, text="Rechercher", command=self._go, font=BUTTON_FONT
@@ -1,39 +1,208 @@
 import geopandas as gpd
-import pandas as pd
 import requests
-from typing import Tuple, List
-from .config import WFS_URL, DEFAULT_CRS_2154, USER_AGENT, TIMEOUT, LAYER_BUILDINGS, LAYER_PARCELLES, ALTI_URL
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, List, Optional
+from .config import (WFS_URL, DEFAULT_CRS_2154, TIMEOUT, LAYER_BUILDINGS, LAYER_PARCELLES, ALTI_URL,
+                     WFS_PAGE_WORKERS, WFS_PAGE_RETRIES, STREAM_RESPONSES, ALTI_MAX_POINTS,
+                     ALTI_RATE, ALTI_BURST, ALTI_CONCURRENCY, ALTI_RETRIES,
+                     ALTI_TOLERANCE, ALTI_COARSE_FACTOR)
+import numpy as np
+from shapely.geometry import box
+from .tilecache import TileCache, merge_tiles
+from .altistore import AltiStore, quantize
+from .ratelimit import RateLimiter, parse_retry_after
+from .crsmap import get_transformer
+from . import transport
+from .metrics import Metrics, NO_METRICS
+from .cancel import CancelToken, check, sleep
+from .features import FeatureTable, loads
+from .jsonstream import iter_feature_batches, read_feature_table, read_number_array
 import math
-import time
+import re
 
-session = requests.Session()
-session.headers.update({"User-Agent": USER_AGENT})
+def _wfs_get_features(params: dict, retries: int = WFS_PAGE_RETRIES, metrics: Metrics = NO_METRICS, task=None,
+                      cancel: Optional[CancelToken] = None, table: bool = False, stream: bool = STREAM_RESPONSES):
+    """
+    One GetFeature page: its features as a list of dicts, or a FeatureTable with `table`.
+    With `stream` the body is parsed batch by batch as it arrives instead of all at once.
+    """
+    crs = params.get("srsName")
+    with metrics.span(f"wfs_page:{params['typenames'].split(':')[-1]}", start_index=params.get("startIndex")) as rec:
+        for attempt in range(retries + 1):
+            try:
+                if stream:
+                    with transport.stream("GET", WFS_URL, params=params, timeout=TIMEOUT, cancel=cancel) as (r, chunks):
+                        r.raise_for_status()
+                        if table:
+                            feats = read_feature_table(chunks, crs)
+                        else:
+                            feats = [f for batch in iter_feature_batches(chunks) for f in batch]
+                else:
+                    r = transport.get(WFS_URL, params=params, timeout=TIMEOUT, cancel=cancel)
+                    r.raise_for_status()
+                    feats = loads(r.content).get("features", [])
+                    if table:
+                        feats = FeatureTable.from_features(feats, crs)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError, ValueError):
+                if attempt >= retries:
+                    raise
+                sleep(0.5 * 2 ** attempt, cancel)
+        rec["bytes"] = transport.wire_bytes(r)
+        rec["items"] = len(feats)
+    if task:
+        metrics.advance(task)
+    return feats
+
+def _getfeature_params(layer_name, bbox, crs, count, start):
+    return {
+        "service":"WFS","version":"2.0.0","request":"GetFeature",
+        "typenames":layer_name,"count":count,"startIndex":start,
+        "srsName":crs,"outputFormat":"application/json",
+        "bbox":",".join(f"{v:.3f}" for v in bbox)+f",{crs}"
+    }
 
-def _wfs_get_json(params: dict):
-    r = session.get(WFS_URL, params=params, timeout=TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+def wfs_hit_count(layer_name: str, bbox: Tuple[float,float,float,float], crs=DEFAULT_CRS_2154,
+                  metrics: Metrics = NO_METRICS, cancel: Optional[CancelToken] = None) -> Optional[int]:
+    """Number of features matching the bbox (resultType=hits), None if the server does not say."""
+    params = {
+        "service":"WFS","version":"2.0.0","request":"GetFeature",
+        "typenames":layer_name,"resultType":"hits",
+        "bbox":",".join(f"{v:.3f}" for v in bbox)+f",{crs}"
+    }
+    try:
+        with metrics.span(f"wfs_hits:{layer_name.split(':')[-1]}") as rec:
+            r = transport.get(WFS_URL, params=params, timeout=TIMEOUT, cancel=cancel)
+            r.raise_for_status()
+            rec["bytes"] = transport.wire_bytes(r)
+    except requests.RequestException:
+        return None
+    m = re.search(r'numberMatched="(\d+)"', r.text)
+    return int(m.group(1)) if m else None
 
-def fetch_layer(layer_name: str, bbox: Tuple[float,float,float,float], crs=DEFAULT_CRS_2154, max_per_page=5000):
-    start = 0; frames=[]
+def _fetch_pages_sequential(layer_name, bbox, crs, max_per_page, start=0, metrics=NO_METRICS, task=None, cancel=None,
+                            **page):
+    pages = []
+    if task:
+        metrics.plan(task, 1, add=True)  # page count unknown: one more page each time a page comes back full
     while True:
-        params = {
-            "service":"WFS","version":"2.0.0","request":"GetFeature",
-            "typenames":layer_name,"count":max_per_page,"startIndex":start,
-            "srsName":crs,"outputFormat":"application/json",
-            "bbox":",".join(f"{v:.3f}" for v in bbox)+f",{crs}"
-        }
-        data = _wfs_get_json(params)
-        feats = data.get("features", [])
-        if not feats: break
-        gdf = gpd.GeoDataFrame.from_features(feats, crs=crs)
-        frames.append(gdf)
+        feats = _wfs_get_features(_getfeature_params(layer_name, bbox, crs, max_per_page, start), metrics=metrics,
+                                  task=task, cancel=cancel, **page)
+        if not len(feats): break
+        pages.append(feats)
         if len(feats) < max_per_page: break
         start += max_per_page
+        if task:
+            metrics.plan(task, 1, add=True)
+    return pages
+
+def _fetch_pages_parallel(layer_name, bbox, crs, max_per_page, workers, metrics=NO_METRICS, task=None, cancel=None,
+                          **page):
+    total = wfs_hit_count(layer_name, bbox, crs, metrics, cancel)
+    if total is None:
+        return _fetch_pages_sequential(layer_name, bbox, crs, max_per_page, metrics=metrics, task=task, cancel=cancel,
+                                       **page)
+    if total == 0:
+        if task:
+            metrics.plan(task, 0, add=True)
+        return []
+    starts = list(range(0, total, max_per_page))
+    if len(starts) == 1:
+        return _fetch_pages_sequential(layer_name, bbox, crs, max_per_page, metrics=metrics, task=task, cancel=cancel,
+                                       **page)
+    if task:
+        metrics.plan(task, len(starts), add=True)
+    def get_page(start):
+        params = _getfeature_params(layer_name, bbox, crs, max_per_page, start)
+        return _wfs_get_features(params, metrics=metrics, task=task, cancel=cancel, **page)
+    # executor.map keeps pages in startIndex order
+    with ThreadPoolExecutor(max_workers=min(workers, len(starts))) as pool:
+        pages = [p for p in pool.map(get_page, starts) if len(p)]
+    # the layer may have grown since the hit count: finish sequentially
+    if pages and len(pages[-1]) == max_per_page and len(pages) == len(starts):
+        pages.extend(_fetch_pages_sequential(layer_name, bbox, crs, max_per_page, start=starts[-1] + max_per_page,
+                                             metrics=metrics, task=task, cancel=cancel, **page))
+    return pages
+
+def _fetch_pages(layer_name, bbox, crs, max_per_page, parallel, workers, metrics=NO_METRICS, task=None, cancel=None,
+                 **page):
+    """Every page of the layer in `bbox`; `page` (table, stream) goes to _wfs_get_features."""
+    if parallel:
+        return _fetch_pages_parallel(layer_name, bbox, crs, max_per_page, workers, metrics, task, cancel, **page)
+    return _fetch_pages_sequential(layer_name, bbox, crs, max_per_page, metrics=metrics, task=task, cancel=cancel,
+                                   **page)
+
+def _fetch_features_cached(layer_name, bbox, crs, max_per_page, parallel, workers, cache, metrics=NO_METRICS, task=None,
+                           cancel=None, stream=STREAM_RESPONSES, convert=None):
+    """
+    Features of every cache tile over `bbox`. The missing tiles are downloaded as one
+    request over their union and split into tiles here. With `convert` (e.g. into a
+    FeatureTable) each tile is converted as soon as it is read or stored, and the list
+    of converted tiles is returned unmerged.
+    """
+    found, missing = cache.lookup(layer_name, crs, cache.tiles_for_bbox(bbox), convert)
+    metrics.count(f"tiles_cached:{layer_name.split(':')[-1]}", len(found))
+    if missing:
+        # a request per tile would pay a hits call and a round trip for every 250 m
+        pages = _fetch_pages(layer_name, cache.union_bbox(missing), crs, max_per_page, parallel, workers, metrics,
+                             task, cancel, stream=stream)
+        feats = [f for page in pages for f in page]
+        bounds = FeatureTable.from_features(feats, crs, columns=()).bounds() if feats else []
+        for tile, tile_feats in cache.split(feats, bounds, missing).items():
+            cache.put(layer_name, crs, tile, tile_feats)
+            found[tile] = convert(tile_feats) if convert is not None else tile_feats
+        cache.evict()
+    if convert is not None:
+        return [found[t] for t in sorted(found)]
+    return merge_tiles(found[t] for t in sorted(found))
+
+def fetch_layer(layer_name: str, bbox: Tuple[float,float,float,float], crs=DEFAULT_CRS_2154, max_per_page=5000,
+                parallel=False, workers=WFS_PAGE_WORKERS, cache: Optional[TileCache]=None,
+                metrics: Optional[Metrics] = None, task: Optional[str] = None, cancel: Optional[CancelToken] = None,
+                table: bool = False, stream: bool = STREAM_RESPONSES):
+    """
+    Fetch every feature of `layer_name` in `bbox`. With `parallel=True` the total is asked
+    first (resultType=hits) and all pages are requested at once on `workers` threads.
+    With a `cache`, the bbox is split into cache tiles and only missing tiles are downloaded.
+    Pages are timed on `metrics`, and progress is reported there under `task`.
+    A cancelled `cancel` token raises cancel.Cancelled; layers fetched by then stay cached.
+    With `table=True` the result is a features.FeatureTable instead of a GeoDataFrame.
+    With `stream=True` pages are parsed while they download (see jsonstream), and a
+    table is built batch by batch, so a page is never in memory as a whole.
+    """
+    metrics = metrics or NO_METRICS
+    if cache is not None and cache.supports(crs):
+        if table:
+            # one table per tile: the merge and dedup work on arrays, not on dicts
+            tiles = _fetch_features_cached(layer_name, bbox, crs, max_per_page, parallel, workers, cache, metrics,
+                                           task, cancel, stream, convert=lambda f: FeatureTable.from_features(f, crs))
+            out = FeatureTable.concat(tiles).drop_duplicate_ids() if tiles else FeatureTable.empty_table(crs)
+            # envelope test on the coordinate arrays: the exact one is clip_to_extent's, on the export extent
+            return out.take(out.in_bbox(bbox))
+        feats = _fetch_features_cached(layer_name, bbox, crs, max_per_page, parallel, workers, cache, metrics, task,
+                                       cancel, stream)
+        if not feats:
+            return gpd.GeoDataFrame(geometry=[], crs=crs)
+        gdf = gpd.GeoDataFrame.from_features(feats, crs=crs)
+        # tiles cover more than the bbox: keep what the WFS bbox filter would have returned
+        return gdf[gdf.intersects(box(*bbox))].reset_index(drop=True)
+    pages = _fetch_pages(layer_name, bbox, crs, max_per_page, parallel, workers, metrics, task, cancel,
+                         table=table, stream=stream)
+    if table:
+        return FeatureTable.concat(pages) if pages else FeatureTable.empty_table(crs)
+    frames = [gpd.GeoDataFrame.from_features(feats, crs=crs) for feats in pages]
     return gpd.pd.concat(frames, ignore_index=True) if frames else gpd.GeoDataFrame(geometry=[], crs=crs)
 
-def fetch_buildings(bbox, crs=DEFAULT_CRS_2154, max_per_page=5000):
-    out = fetch_layer(LAYER_BUILDINGS, bbox, crs, max_per_page)
+BUILDING_COLUMNS = {
+    "hauteur": ("hauteur", "height", "hauteur_val", "hauteur_value", "heightaboveground_value"),
+    "altitude_maximale_toit": ("altitude_maximale_toit",),
+    "altitude_minimale_toit": ("altitude_minimale_toit",),
+}
+
+def fetch_buildings(bbox, crs=DEFAULT_CRS_2154, max_per_page=5000, **kwargs):
+    out = fetch_layer(LAYER_BUILDINGS, bbox, crs, max_per_page, **kwargs)
+    if isinstance(out, FeatureTable):
+        return out.select(BUILDING_COLUMNS)
     
     if out.empty:
         return gpd.GeoDataFrame(columns=["geometry","hauteur"], geometry="geometry", crs=crs)
@@ -58,96 +227,192 @@ def fetch_buildings(bbox, crs=DEFAULT_CRS_2154, max_per_page=5000):
     
     return out[["geometry","hauteur", "altitude_maximale_toit", "altitude_minimale_toit"]]
 
-def fetch_parcelles(bbox, crs=DEFAULT_CRS_2154, max_per_page=5000):
-    out = fetch_layer(LAYER_PARCELLES, bbox, crs, max_per_page)
+def fetch_parcelles(bbox, crs=DEFAULT_CRS_2154, max_per_page=5000, **kwargs):
+    out = fetch_layer(LAYER_PARCELLES, bbox, crs, max_per_page, **kwargs)
+    if isinstance(out, FeatureTable):
+        return out.select({})
     return out[["geometry"]] if not out.empty else gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs=crs)
 
-def fetch_alti(addr, distance_m = 200, pas_metre = 5) :
-    last_request_time = 0
-    min_interval = 5
-    
-    point_wgs84 = (addr.lon, addr.lat)
-    
-    pas_kilometre = pas_metre/1000
-    distance_km = distance_m/1000
-    
-    pas_lat =pas_kilometre / 111.32
-    pas_lon =pas_kilometre/ (111.32 * math.cos(math.radians(point_wgs84[1])))
-    
-    delta_lat = distance_km / 111.32
-    delta_lon = distance_km / (111.32 * math.cos(math.radians(point_wgs84[1])))
-    
-    minlat = point_wgs84[1] - delta_lat
-    maxlat = point_wgs84[1] + delta_lat
-    minlon = point_wgs84[0] - delta_lon
-    maxlon = point_wgs84[0] + delta_lon
-    
-    x = minlat
-    list_lat = []
-    while x < maxlat :
-        list_lat.append(x)
-        x+=pas_lat
-    list_lat.append(maxlat)
-    
-    y = minlon
-    list_lon = []
-    while y < maxlon :
-        list_lon.append(y)
-        y+=pas_lon
-    list_lon.append(maxlon)
-    
-    pt_lon =[]
-    pt_lat =[]
-    
-    for x in list_lon :
-        for y in list_lat :
-            pt_lon.append(x)
-            pt_lat.append(y)
-    
-    div_lon = len(pt_lon)//5000
-    div_lat = len(pt_lat)//5000
-    
-    pt_lon_chunks = [pt_lon[i*4000:(i+1)*4000] for i in range(div_lon+1)]
-    pt_lat_chunks = [pt_lat[i*4000:(i+1)*4000] for i in range(div_lat+1)]
-    
-    json_responses = []
-    
+def _grid_range(addr, distance_m, pas_metre, crs):
+    """Integer node indices (in units of `pas_metre`, in `crs`) covering `distance_m` around `addr`."""
+    cx, cy = get_transformer("EPSG:4326", crs).transform(addr.lon, addr.lat)
+    ix = np.arange(math.floor((cx - distance_m) / pas_metre), math.ceil((cx + distance_m) / pas_metre) + 1)
+    iy = np.arange(math.floor((cy - distance_m) / pas_metre), math.ceil((cy + distance_m) / pas_metre) + 1)
+    return ix, iy
+
+def alti_grid(addr, distance_m = 200, pas_metre = 5, crs=DEFAULT_CRS_2154):
+    """
+    Sampling grid covering `distance_m` around `addr`, built in the metric `crs` on
+    multiples of `pas_metre` (so overlapping jobs share nodes) and projected back to
+    WGS84 in one call. Returns flat arrays x, y (in `crs`), lon, lat.
+    """
+    ix, iy = _grid_range(addr, distance_m, pas_metre, crs)
+    gx, gy = np.meshgrid(ix * float(pas_metre), iy * float(pas_metre), indexing="ij")
+    x, y = gx.ravel(), gy.ravel()
+    lon, lat = get_transformer(crs, "EPSG:4326").transform(x, y)
+    return x, y, np.asarray(lon), np.asarray(lat)
+
+def _alti_request(lon, lat, limiter: RateLimiter, retries: int = ALTI_RETRIES, metrics: Metrics = NO_METRICS,
+                  cancel: Optional[CancelToken] = None, stream: bool = STREAM_RESPONSES):
+    """
+    One altimetry POST for up to ALTI_MAX_POINTS points, returns z as an array.
+    With `stream` the elevations are parsed as the body arrives.
+    """
     headers = {
     "Accept": "application/json",
     "Content-Type": "application/json",
-    "Connection": "close"
     }
+    params = {
+        "lon": ";".join(np.char.mod("%.7f", lon)),
+        "lat": ";".join(np.char.mod("%.7f", lat)),
+        "resource": "ign_rge_alti_wld",
+        "delimiter": ";",
+        "indent": "false",
+        "measure" : "false",
+        "zonly" : "true"
+    }
+    with metrics.span("alti_chunk") as rec:
+        for attempt in range(retries + 1):
+            limiter.acquire(cancel)
+            if stream:
+                with transport.stream("POST", ALTI_URL, json=params, headers=headers, timeout=(10, 120),
+                                      cancel=cancel) as (response, chunks):
+                    if response.status_code in (429, 503) and attempt < retries:
+                        limiter.penalize(parse_retry_after(response.headers.get("Retry-After")))
+                        metrics.count("alti_throttled")
+                        continue
+                    response.raise_for_status()
+                    limiter.reward()
+                    z = read_number_array(chunks, "elevations")
+                    nbytes = transport.wire_bytes(response)
+                break
+            response = transport.post(ALTI_URL, json=params, headers=headers, timeout=(10, 120), cancel=cancel)
+            if response.status_code in (429, 503) and attempt < retries:
+                limiter.penalize(parse_retry_after(response.headers.get("Retry-After")))
+                metrics.count("alti_throttled")
+                continue
+            response.raise_for_status()
+            limiter.reward()
+            z = np.asarray(loads(response.content).get("elevations", []), dtype=float)
+            nbytes = transport.wire_bytes(response)
+            break
+        rec["items"], rec["bytes"] = len(z), nbytes
+    if len(z) != len(lon):
+        raise RuntimeError(f"Réponse altimétrique incomplète : {len(z)} valeurs pour {len(lon)} points")
+    return z
 
-    for pt_lon_chunk, pt_lat_chunk in zip(pt_lon_chunks, pt_lat_chunks) :
-    
-        elapsed = time.time() - last_request_time
-        if elapsed < min_interval:
-            time.sleep(min_interval - elapsed)
-    
-        params = {
-            "lon": ";".join([str(a) for a in pt_lon_chunk]),
-            "lat": ";".join([str(b) for b in pt_lat_chunk]),
-            "resource": "ign_rge_alti_wld",
-            "delimiter": ";",
-            "indent": "true",
-            "measure" : "false",
-            "zonly" : "false"
-        }
-        response = session.post(ALTI_URL, json=params, headers=headers, timeout=(10, 120))
-
-        response.raise_for_status()
-        json_responses.append(response.json())
-        
-        last_request_time = time.time()
-    
-    merged={"elevations":[]}
-    for r in json_responses :
-        merged["elevations"].extend(r.get("elevations",[]))
-    
-    df = pd.DataFrame(merged["elevations"])
-    gdf =gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df["lon"],df["lat"]),crs="EPSG:4326")
-    
-    return gdf[["geometry","z"]]
+# shared by every fetch_alti of the process, so parallel jobs respect the same budget
+alti_limiter = RateLimiter(ALTI_RATE, ALTI_BURST)
+
+def _query_elevations(lon, lat, store=None, limiter=None, concurrency=ALTI_CONCURRENCY, metrics=NO_METRICS,
+                      cancel=None):
+    """
+    z for every lon/lat: known points come from `store`, the others are requested in
+    chunks, `concurrency` at a time through `limiter`, and stored as each chunk arrives.
+    Once `cancel` fires, chunks still queued are not sent.
+    """
+    limiter = limiter or alti_limiter
+    qlon, qlat = quantize(lon, lat)
+    z = store.lookup(qlon, qlat) if store is not None else np.full(len(lon), np.nan)
+    missing = np.flatnonzero(np.isnan(z))
+    chunks = [missing[i:i + ALTI_MAX_POINTS] for i in range(0, len(missing), ALTI_MAX_POINTS)]
+    metrics.count("alti_store_hits", len(lon) - len(missing))
+    metrics.plan("alti", len(chunks), add=True)
+
+    def get_chunk(idx):
+        check(cancel)
+        zc = _alti_request(lon[idx], lat[idx], limiter, metrics=metrics, cancel=cancel)
+        z[idx] = zc
+        if store is not None:
+            store.store_chunk(qlon[idx], qlat[idx], zc)
+        metrics.advance("alti")
+
+    if chunks:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as pool:
+            for _ in pool.map(get_chunk, chunks):
+                pass
+    return z
+
+def _adaptive_nodes(addr, distance_m, pas_metre, crs, tolerance, coarse_factor=ALTI_COARSE_FACTOR, **query):
+    """
+    Quadtree sampling: start from a grid `coarse_factor` times coarser than `pas_metre`,
+    then for each cell sample its centre and edge midpoints and split it in four while the
+    midpoints differ from the linear interpolation of the corners by more than `tolerance`.
+    All nodes stay on the `pas_metre` lattice. Returns x, y, z of the sampled nodes.
+    """
+    ix, iy = _grid_range(addr, distance_m, pas_metre, crs)
+    s = 1
+    while s * 2 <= coarse_factor:
+        s *= 2
+    # extend the lattice so it is a whole number of coarse cells
+    nx = math.ceil((len(ix) - 1) / s) * s + 1
+    ny = math.ceil((len(iy) - 1) / s) * s + 1
+    Z = np.full((nx, ny), np.nan)
+    to_wgs = get_transformer(crs, "EPSG:4326")
+
+    def sample(a, b):
+        keep = np.isnan(Z[a, b])
+        a, b = a[keep], b[keep]
+        if len(a) == 0:
+            return
+        x = (ix[0] + a) * float(pas_metre)
+        y = (iy[0] + b) * float(pas_metre)
+        lon, lat = to_wgs.transform(x, y)
+        Z[a, b] = _query_elevations(np.asarray(lon), np.asarray(lat), **query)
+
+    ga, gb = np.meshgrid(np.arange(0, nx, s), np.arange(0, ny, s), indexing="ij")
+    sample(ga.ravel(), gb.ravel())
+    ca, cb = np.meshgrid(np.arange(0, nx - 1, s), np.arange(0, ny - 1, s), indexing="ij")
+    ca, cb = ca.ravel(), cb.ravel()
+
+    while s > 1 and len(ca):
+        h = s // 2
+        mids = [(ca + h, cb + h), (ca + h, cb), (ca + h, cb + s), (ca, cb + h), (ca + s, cb + h)]
+        na = np.concatenate([m[0] for m in mids])
+        nb = np.concatenate([m[1] for m in mids])
+        uniq = np.unique(np.stack([na, nb], axis=1), axis=0)
+        sample(uniq[:, 0], uniq[:, 1])
+
+        z00, z10, z01, z11 = Z[ca, cb], Z[ca + s, cb], Z[ca, cb + s], Z[ca + s, cb + s]
+        err = np.max(np.abs(np.stack([
+            Z[ca + h, cb + h] - (z00 + z10 + z01 + z11) / 4,
+            Z[ca + h, cb] - (z00 + z10) / 2,
+            Z[ca + h, cb + s] - (z01 + z11) / 2,
+            Z[ca, cb + h] - (z00 + z01) / 2,
+            Z[ca + s, cb + h] - (z10 + z11) / 2,
+        ])), axis=0)
+        # no-data cells (-99999) are not refined
+        nodata = np.min(np.stack([z00, z10, z01, z11]), axis=0) <= -99999.0
+        refine = (err > tolerance) & ~nodata
+        ca, cb = ca[refine], cb[refine]
+        ca = np.concatenate([ca, ca + h, ca, ca + h])
+        cb = np.concatenate([cb, cb, cb + h, cb + h])
+        s = h
+
+    a, b = np.nonzero(~np.isnan(Z))
+    return (ix[0] + a) * float(pas_metre), (iy[0] + b) * float(pas_metre), Z[a, b]
+
+def fetch_alti(addr, distance_m = 200, pas_metre = 5, store: Optional[AltiStore] = None, crs=DEFAULT_CRS_2154,
+               limiter: Optional[RateLimiter] = None, concurrency: int = ALTI_CONCURRENCY,
+               adaptive: bool = False, tolerance: float = ALTI_TOLERANCE, metrics: Optional[Metrics] = None,
+               cancel: Optional[CancelToken] = None) :
+    """
+    Elevation samples every `pas_metre` around `addr`, as points in `crs` with a `z` column.
+    Chunks are sent `concurrency` at a time through `limiter` (token bucket backing off on
+    429/503). With a `store`, only points it does not know yet are queried and every chunk
+    is stored as it arrives (an interrupted run resumes from there).
+    With `adaptive=True` the grid is only refined down to `pas_metre` where the terrain
+    departs from a plane by more than `tolerance` metres.
+    Chunks are timed on `metrics`, and progress is reported there as task "alti".
+    A cancelled `cancel` token raises cancel.Cancelled; chunks stored by then are reused next time.
+    """
+    query = dict(store=store, limiter=limiter, concurrency=concurrency, metrics=metrics or NO_METRICS, cancel=cancel)
+    if adaptive:
+        x, y, z = _adaptive_nodes(addr, distance_m, pas_metre, crs, tolerance, **query)
+    else:
+        x, y, lon, lat = alti_grid(addr, distance_m, pas_metre, crs)
+        z = _query_elevations(lon, lat, **query)
+    return gpd.GeoDataFrame({"z": z}, geometry=gpd.points_from_xy(x, y), crs=crs)[["geometry","z"]]
     
     """
     if out.empty: